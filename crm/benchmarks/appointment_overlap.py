@@ -0,0 +1,145 @@
+# Compares the query plans and timings of the appointment overlap query with and without the composite indexes
+# Usage: bench --site <site> execute crm.benchmarks.appointment_overlap.execute --kwargs "{'no_of_rows': 1000000}"
+
+import frappe
+import datetime
+import random
+import time
+
+benchmark_table = "_appointment_overlap_benchmark"
+appointment_types = ["Benchmark Type A", "Benchmark Type B", "Benchmark Type C"]
+durations = [15, 30, 45, 60]
+
+unbounded_query = """
+	select name, _assign, scheduled_dt, end_dt
+	from `{0}`
+	where docstatus = 1 and status != 'Rescheduled' and appointment_type = %(appointment_type)s
+		and %(start_dt)s < end_dt AND %(end_dt)s > scheduled_dt
+""".format(benchmark_table)
+
+bounded_query = """
+	select name, _assign, scheduled_dt, end_dt
+	from `{0}`
+	where docstatus = 1 and status != 'Rescheduled' and appointment_type = %(appointment_type)s
+		and scheduled_dt >= %(window_start_dt)s and scheduled_dt < %(end_dt)s
+		and %(start_dt)s < end_dt
+""".format(benchmark_table)
+
+composite_indexes = {
+	"appointment_type_docstatus_scheduled_dt_end_dt": "appointment_type, docstatus, scheduled_dt, end_dt",
+	"appointment_type_docstatus_appointment_duration": "appointment_type, docstatus, appointment_duration",
+	"scheduled_date_docstatus": "scheduled_date, docstatus",
+}
+
+
+def execute(no_of_rows=1000000, iterations=20):
+	try:
+		create_benchmark_table()
+		seed_appointments(no_of_rows)
+
+		results = []
+		for with_indexes in (False, True):
+			set_composite_indexes(with_indexes)
+			for label, query in (("unbounded", unbounded_query), ("bounded", bounded_query)):
+				results.append(run_query(label, query, with_indexes, iterations))
+
+		for d in results:
+			print("{label} query, composite indexes: {with_indexes}".format(**d))
+			print("  average: {0:.2f} ms".format(d.average_ms))
+			for row in d.plan:
+				print("  plan: type={type} key={key} rows={rows} extra={Extra}".format(**row))
+
+		return results
+	finally:
+		frappe.db.sql_ddl("drop table if exists `{0}`".format(benchmark_table))
+
+
+def create_benchmark_table():
+	frappe.db.sql_ddl("drop table if exists `{0}`".format(benchmark_table))
+	frappe.db.sql_ddl("""
+		create table `{0}` (
+			name varchar(140) not null primary key,
+			docstatus int(1) not null default 0,
+			status varchar(140),
+			appointment_type varchar(140),
+			scheduled_date date,
+			scheduled_dt datetime(6),
+			end_dt datetime(6),
+			appointment_duration int(11) not null default 0,
+			_assign text,
+			key scheduled_date (scheduled_date),
+			key scheduled_dt (scheduled_dt),
+			key end_dt (end_dt)
+		) engine=InnoDB
+	""".format(benchmark_table))
+
+
+def seed_appointments(no_of_rows, chunk_size=10000):
+	random.seed(0)
+	start_date = datetime.datetime(2015, 1, 1, 9, 0)
+	statuses = ["Open", "Closed", "Missed", "Rescheduled"]
+
+	for chunk_start in range(0, no_of_rows, chunk_size):
+		values = []
+		for i in range(chunk_start, min(chunk_start + chunk_size, no_of_rows)):
+			duration = random.choice(durations)
+			scheduled_dt = start_date + datetime.timedelta(days=random.randint(0, 3650),
+				minutes=random.randint(0, 36) * 15)
+			end_dt = scheduled_dt + datetime.timedelta(minutes=duration)
+			values.append((
+				"BENCH-{0:07d}".format(i), random.choice([0, 1, 1, 1, 2]), random.choice(statuses),
+				random.choice(appointment_types), scheduled_dt.date(), scheduled_dt, end_dt, duration
+			))
+
+		frappe.db.sql("""
+			insert into `{0}` (name, docstatus, status, appointment_type, scheduled_date, scheduled_dt, end_dt,
+				appointment_duration)
+			values {1}
+		""".format(benchmark_table, ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(values))),
+			[v for row in values for v in row])
+
+	frappe.db.sql("analyze table `{0}`".format(benchmark_table))
+
+
+def set_composite_indexes(with_indexes):
+	existing_indexes = set(d.Key_name for d in frappe.db.sql("show index from `{0}`".format(benchmark_table),
+		as_dict=1))
+
+	for index_name, columns in composite_indexes.items():
+		if with_indexes and index_name not in existing_indexes:
+			frappe.db.sql_ddl("alter table `{0}` add index `{1}` ({2})".format(benchmark_table, index_name, columns))
+		elif not with_indexes and index_name in existing_indexes:
+			frappe.db.sql_ddl("alter table `{0}` drop index `{1}`".format(benchmark_table, index_name))
+
+
+def run_query(label, query, with_indexes, iterations):
+	max_duration = frappe.db.sql("""
+		select max(appointment_duration)
+		from `{0}`
+		where appointment_type = %s and docstatus = 1
+	""".format(benchmark_table), appointment_types[0])[0][0] or 0
+
+	def get_args():
+		start_dt = datetime.datetime(2020, 1, 1, 9, 0) + datetime.timedelta(days=random.randint(0, 365))
+		return {
+			'appointment_type': appointment_types[0],
+			'start_dt': start_dt,
+			'end_dt': start_dt + datetime.timedelta(hours=9),
+			'window_start_dt': start_dt - datetime.timedelta(minutes=max_duration),
+		}
+
+	plan = frappe.db.sql("explain " + query, get_args(), as_dict=1)
+
+	timings = []
+	for i in range(iterations):
+		args = get_args()
+		start = time.perf_counter()
+		frappe.db.sql(query, args)
+		timings.append(time.perf_counter() - start)
+
+	return frappe._dict({
+		'label': label,
+		'with_indexes': with_indexes,
+		'average_ms': sum(timings) / len(timings) * 1000,
+		'plan': plan,
+	})
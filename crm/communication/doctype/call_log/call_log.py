@@ -6,8 +6,18 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 from crm.crm.utils import get_scheduled_employees_for_popup, strip_number
-from frappe.contacts.doctype.contact.contact import get_contact_with_phone_number
 from crm.crm.doctype.lead.lead import get_lead_with_phone_number
+from crm.crm.phone_number_index import find_by_phone_number, find_by_phone_numbers, setup_phone_number_table,\
+	normalize_number, get_reversed_number, get_numbers, insert_phone_numbers, delete_phone_number_index,\
+	phone_number_fields
+import time
+
+
+employees_with_number_expiry = 3600
+employees_with_number_negative_expiry = 60
+employees_with_number_cache_size = 10000
+employee_number_map_expiry = 6 * 3600
+caller_information_background_threshold = 500
 
 
 class CallLog(Document):
@@ -17,6 +27,7 @@ class CallLog(Document):
 		self.lead = get_lead_with_phone_number(number)
 
 	def after_insert(self):
+		insert_phone_numbers({(self.doctype, self.name): get_numbers(self)})
 		self.trigger_call_popup()
 
 	def on_update(self):
@@ -27,6 +38,9 @@ class CallLog(Document):
 		elif doc_before_save.to != self.to:
 			self.trigger_call_popup()
 
+	def on_trash(self):
+		delete_phone_number_index(self)
+
 	def trigger_call_popup(self):
 		scheduled_employees = get_scheduled_employees_for_popup(self.medium)
 		employee_emails = get_employees_with_number(self.to)
@@ -41,6 +55,17 @@ class CallLog(Document):
 			frappe.publish_realtime('show_call_popup', self, user=email)
 
 
+def on_doctype_update():
+	setup_phone_number_table()
+
+
+def get_contact_with_phone_number(number):
+	if not number: return
+
+	contacts = find_by_phone_number(number, "Contact", limit=1)
+	return contacts[0] if contacts else None
+
+
 @frappe.whitelist()
 def add_call_summary(call_log, summary):
 	doc = frappe.get_doc('Call Log', call_log)
@@ -48,51 +73,189 @@ def add_call_summary(call_log, summary):
 
 
 def get_employees_with_number(number):
-	number = strip_number(number)
+	number = normalize_number(number)
 	if not number: return []
 
-	employee_emails = frappe.cache().hget('employees_with_number', number)
-	if employee_emails: return employee_emails
+	key = "employees_with_number:{0}".format(number)
+	employee_emails = frappe.cache().get_value(key)
+	if employee_emails is not None:
+		touch_employees_with_number_key(key)
+		return employee_emails
 
-	employees = frappe.get_all('Employee', filters={
-		'cell_number': ['like', '%{}%'.format(number)],
-		'user_id': ['!=', '']
-	}, fields=['user_id'])
+	employee_number_map = get_employee_number_map()
+	employee_emails = sorted(set(user_id
+		for employee_number, user_ids in employee_number_map.items() if number in employee_number
+		for user_id in user_ids))
 
-	employee_emails = [employee.user_id for employee in employees]
-	frappe.cache().hset('employees_with_number', number, employee_emails)
+	# cache numbers without any employee for a shorter time
+	expires_in_sec = employees_with_number_expiry if employee_emails else employees_with_number_negative_expiry
+	frappe.cache().set_value(key, employee_emails, expires_in_sec=expires_in_sec)
+	touch_employees_with_number_key(key)
 
 	return employee_emails
 
 
+def get_employee_number_map():
+	employee_number_map = frappe.cache().get_value("employee_number_map")
+	if employee_number_map is None:
+		employee_number_map = warmup_employee_number_map()
+
+	return employee_number_map
+
+
+def warmup_employee_number_map():
+	"""Loads and caches a map of normalized cell numbers to user ids of active employees"""
+	employees = frappe.db.sql("""
+		select cell_number, user_id
+		from `tabEmployee`
+		where status = 'Active' and ifnull(user_id, '') != '' and ifnull(cell_number, '') != ''
+	""", as_dict=1)
+
+	employee_number_map = {}
+	for d in employees:
+		number = normalize_number(d.cell_number)
+		if number:
+			employee_number_map.setdefault(number, []).append(d.user_id)
+
+	frappe.cache().set_value("employee_number_map", employee_number_map, expires_in_sec=employee_number_map_expiry)
+	return employee_number_map
+
+
+def touch_employees_with_number_key(key):
+	# least recently used number keys are evicted once the cache grows beyond its size limit
+	cache = frappe.cache()
+	lru_key = cache.make_key("employees_with_number_lru")
+
+	cache.zadd(lru_key, {key: time.time()})
+
+	overflow = cache.zcard(lru_key) - employees_with_number_cache_size
+	if overflow > 0:
+		evicted_keys = [frappe.safe_decode(k) for k, score in cache.zpopmin(lru_key, overflow)]
+		cache.delete_value(evicted_keys)
+
+
+def clear_employees_with_number_cache(doc=None, method=None):
+	cache = frappe.cache()
+	lru_key = cache.make_key("employees_with_number_lru")
+
+	keys = [frappe.safe_decode(k) for k in cache.zrange(lru_key, 0, -1)]
+	if keys:
+		cache.delete_value(keys)
+
+	cache.delete(lru_key)
+	cache.delete_value(["employee_number_map", "employees_with_number"])
+
+
 def set_caller_information(doc, state):
 	'''Called from hooks on creation of Lead or Contact'''
 	if doc.doctype not in ['Lead', 'Contact']: return
 
-	numbers = [doc.get('phone'), doc.get('mobile_no')]
+	# imported parties are matched in bulk by the scheduler instead of one at a time
+	if frappe.flags.in_import:
+		frappe.cache().sadd(get_pending_caller_information_key(doc.doctype), doc.name)
+		return
+
+	set_caller_information_for_parties(doc.doctype, {doc.name: get_numbers(doc)}, {doc.name: doc.get_title()})
+
+
+def set_caller_information_in_bulk(party_doctype, names):
+	'''Sets caller information on Call Logs for many Leads or Contacts in one pass, eg. after a data import'''
+	if party_doctype not in ['Lead', 'Contact'] or not names: return
+
+	title_field = frappe.get_meta(party_doctype).get_title_field()
+	number_fields = phone_number_fields.get(party_doctype, [])
+
+	party_numbers = {}
+	party_titles = {}
+	for i in range(0, len(names), 1000):
+		chunk = names[i:i + 1000]
+
+		parties = frappe.get_all(party_doctype, filters={'name': ['in', chunk]},
+			fields=list(set(['name', title_field] + number_fields)))
+
+		for d in parties:
+			party_titles[d.name] = d.get(title_field)
+			party_numbers[d.name] = [d.get(f) for f in number_fields]
+
+		if party_doctype == 'Contact':
+			for d in frappe.get_all('Contact Phone', filters={'parenttype': 'Contact', 'parent': ['in', chunk]},
+					fields=['parent', 'phone']):
+				party_numbers.setdefault(d.parent, []).append(d.phone)
+
+	set_caller_information_for_parties(party_doctype, party_numbers, party_titles)
+
+
+def set_caller_information_for_parties(party_doctype, party_numbers, party_titles):
+	# the first party with a number is set as the caller for that number
+	party_by_reversed_number = {}
+	for name, numbers in party_numbers.items():
+		for number in numbers:
+			reversed_number = get_reversed_number(number)
+			if reversed_number:
+				party_by_reversed_number.setdefault(reversed_number, name)
+
+	if not party_by_reversed_number: return
+
+	numbers = [reversed_number[::-1] for reversed_number in party_by_reversed_number]
+
+	call_log_party = {}
+	for call_log_number, call_log in find_by_phone_numbers(numbers, "Call Log"):
+		# caller's number ends with the party's number, prefer the longest match
+		for length in range(len(call_log_number), 0, -1):
+			party = party_by_reversed_number.get(call_log_number[:length])
+			if party:
+				call_log_party.setdefault(call_log, party)
+				break
+
+	if not call_log_party: return
+
+	if len(call_log_party) > caller_information_background_threshold:
+		frappe.enqueue("crm.communication.doctype.call_log.call_log.update_call_log_caller_information",
+			queue="long", party_doctype=party_doctype, call_log_party=call_log_party,
+			party_titles={party: party_titles.get(party) for party in set(call_log_party.values())})
+	else:
+		update_call_log_caller_information(party_doctype, call_log_party, party_titles)
+
+
+def update_call_log_caller_information(party_doctype, call_log_party, party_titles, chunk_size=1000):
 	# contact for Contact and lead for Lead
-	fieldname = doc.doctype.lower()
+	fieldname = party_doctype.lower()
 
 	# contact_name or lead_name
 	display_name_field = '{}_name'.format(fieldname)
 
-	# Contact now has all the nos saved in child table
-	if doc.doctype == 'Contact':
-		numbers = [d.phone for d in doc.phone_nos]
+	call_logs = sorted(call_log_party)
+	for i in range(0, len(call_logs), chunk_size):
+		chunk = call_logs[i:i + chunk_size]
+
+		party_values = []
+		title_values = []
+		for call_log in chunk:
+			party = call_log_party[call_log]
+			party_values += [call_log, party]
+			title_values += [call_log, party_titles.get(party)]
+
+		frappe.db.sql("""
+			update `tabCall Log`
+			set `{fieldname}` = case name {when} end,
+				`{display_name_field}` = case name {when} end
+			where name in ({names}) and ifnull(`{fieldname}`, '') = ''
+		""".format(
+			fieldname=fieldname,
+			display_name_field=display_name_field,
+			when=" ".join(["when %s then %s"] * len(chunk)),
+			names=", ".join(["%s"] * len(chunk))
+		), party_values + title_values + chunk)
 
-	for number in numbers:
-		number = strip_number(number)
-		if not number: continue
 
-		filters = frappe._dict({
-			'from': ['like', '%{}'.format(number)],
-			fieldname: ''
-		})
+def set_pending_caller_information():
+	for party_doctype in ['Lead', 'Contact']:
+		key = get_pending_caller_information_key(party_doctype)
+		names = [frappe.safe_decode(name) for name in frappe.cache().smembers(key)]
+		if names:
+			set_caller_information_in_bulk(party_doctype, names)
+			frappe.cache().srem(key, *names)
 
-		logs = frappe.get_all('Call Log', filters=filters)
 
-		for log in logs:
-			frappe.db.set_value('Call Log', log.name, {
-				fieldname: doc.name,
-				display_name_field: doc.get_title()
-			}, update_modified=False)
+def get_pending_caller_information_key(party_doctype):
+	return "pending_caller_information:{0}".format(party_doctype)
@@ -4,6 +4,12 @@
 
 # import frappe
 from frappe.model.document import Document
+from crm.crm.utils import clear_communication_medium_schedule
+
 
 class CommunicationMedium(Document):
-	pass
+	def on_update(self):
+		clear_communication_medium_schedule(self)
+
+	def on_trash(self):
+		clear_communication_medium_schedule(self)
@@ -36,6 +36,9 @@ extend_cscript(cur_frm.cscript, {
 	},
 
 	receiver_list() {
+		// an edited receiver list replaces the full receiver list created on the server
+		this.frm.set_value("receiver_list_file", null);
+
 		let receivers = cstr(this.frm.doc.receiver_list).split('\n').filter(d => d);
 		this.frm.set_value("total_receivers", receivers.length);
 	},
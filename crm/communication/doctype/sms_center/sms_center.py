@@ -6,12 +6,69 @@ from frappe import _
 from frappe.utils import cstr, cint, get_datetime, now_datetime
 from frappe.model.document import Document
 from frappe.core.doctype.sms_settings.sms_settings import send_sms, clean_receiver_number
+from crm.communication.doctype.sms_dispatch_log.sms_dispatch_log import create_sms_dispatch_log
+from itertools import islice, chain
+import csv
+import os
+import re
+import time
+
+
+receiver_list_preview_limit = 1000
 
 
 class SMSCenter(Document):
 	@frappe.whitelist()
 	def create_receiver_list(self):
-		receivers = []
+		receiver_query = self.get_receiver_query()
+
+		token = frappe.generate_hash(length=20)
+		path = get_receiver_list_file_path(token)
+		raw_path = path + ".raw"
+
+		with open(raw_path, "w", newline="") as raw_file:
+			if receiver_query:
+				write_query_rows(receiver_query, raw_file)
+
+		preview = []
+		total_receivers = 0
+		numbers_visited = set()
+
+		with open(raw_path, newline="") as raw_file, open(path, "w") as receiver_file:
+			for name, number in csv.reader(raw_file):
+				number = clean_receiver_number(number)
+				if not number:
+					continue
+
+				number_key = get_number_key(number)
+				if number_key in numbers_visited:
+					continue
+
+				numbers_visited.add(number_key)
+
+				name = " ".join(name.replace("|", " ").split())
+				receiver = f"{name} | {number}" if name else number
+				receiver_file.write(receiver + "\n")
+
+				if total_receivers < receiver_list_preview_limit:
+					preview.append(receiver)
+				total_receivers += 1
+
+		os.remove(raw_path)
+
+		self.receiver_list = "\n".join(preview)
+		self.total_receivers = total_receivers
+
+		if total_receivers > receiver_list_preview_limit:
+			self.receiver_list_file = token
+			frappe.msgprint(_("Showing the first {0} of {1} receivers").format(
+				frappe.bold(receiver_list_preview_limit), frappe.bold(total_receivers)))
+		else:
+			self.receiver_list_file = None
+			os.remove(path)
+
+	def get_receiver_query(self):
+		receiver_query = None
 
 		if self.send_to in ['All Contact', 'All Customer Contact', 'All Supplier Contact', 'All Sales Partner Contact']:
 			self.is_promotional = 1
@@ -35,23 +92,23 @@ class SMSCenter(Document):
 				join = ""
 
 			conditions = " and {0}".format(" and ".join(conditions)) if conditions else ""
-			receivers = frappe.db.sql("""
+			receiver_query = """
 				select distinct c.full_name, c.mobile_no
 				from `tabContact` c
 				{0}
 				where ifnull(c.mobile_no,'') != '' {1}
 				order by c.full_name
-			""".format(join, conditions))
+			""".format(join, conditions)
 
 		elif self.send_to == 'All Lead (Open)':
 			self.is_promotional = 1
 
-			receivers = frappe.db.sql("""
+			receiver_query = """
 				select lead_name, mobile_no
 				from `tabLead`
 				where ifnull(mobile_no, '') != '' and status = 'Open'
 				order by lead_name
-			""")
+			"""
 
 		elif self.send_to == 'All Employee (Active)':
 			conditions = []
@@ -62,78 +119,128 @@ class SMSCenter(Document):
 
 			conditions = " and {0}".format(" and ".join(conditions)) if conditions else ""
 
-			receivers = frappe.db.sql("""
+			receiver_query = """
 				select employee_name, cell_number
 				from `tabEmployee`
 				where status = 'Active' and ifnull(cell_number, '') != '' {0}
 				order by employee_name
-			""".format(conditions))
+			""".format(conditions)
 
 		elif self.send_to == 'All Sales Person':
-			receivers = frappe.db.sql("""
+			receiver_query = """
 				select sp.name, sp.contact_mobile
 				from `tabSales Person` sp
 				where ifnull(sp.contact_mobile,'') != ''
 				order by sp.name
-			""")
+			"""
 
-		numbers_visited = set()
-		receiver_list = []
-		for r in receivers:
-			name, number = r
-			number = clean_receiver_number(number)
-
-			if not number or number in numbers_visited:
-				continue
-
-			if name:
-				receiver_list.append(f"{name} | {number}")
-			else:
-				receiver_list.append(number)
-
-			numbers_visited.add(number)
-
-		self.receiver_list = "\n".join(receiver_list)
-		self.total_receivers = len(receiver_list)
+		return receiver_query
 
 	def get_receiver_nos(self):
-		receiver_nos = []
-		if self.receiver_list:
-			for d in self.receiver_list.split('\n'):
-				receiver_no = cstr(d)
-				if '|' in d:
-					receiver_no = receiver_no.split('|')[-1]
+		return list(self.iter_receiver_nos())
 
-				receiver_no = cstr(receiver_no).strip()
-				if receiver_no:
-					receiver_nos.append(receiver_no)
+	def iter_receiver_nos(self):
+		if self.receiver_list_file:
+			try:
+				receiver_file = open(get_receiver_list_file_path(self.receiver_list_file))
+			except FileNotFoundError:
+				frappe.throw(_("Receiver List file has expired or was removed. Please create Receiver List again"))
 
-		return receiver_nos
+			with receiver_file:
+				yield from parse_receiver_lines(receiver_file)
+		elif self.receiver_list:
+			yield from parse_receiver_lines(self.receiver_list.split('\n'))
 
 	@frappe.whitelist()
 	def send_sms(self):
 		if not self.message:
 			frappe.throw(_("Please enter message before sending"))
 
-		receiver_list = self.get_receiver_nos()
-		if not receiver_list:
+		receiver_nos = self.iter_receiver_nos()
+		first_receivers = list(islice(receiver_nos, 11))
+		if not first_receivers:
 			frappe.throw(_("Receiver List is empty. Please create Receiver List"))
 
 		if self.send_after and get_datetime(self.send_after) < now_datetime():
 			frappe.throw(_("Schedule Send Time cannot be in the past"))
 
-		queue = bool(self.send_after or len(receiver_list) > 10)
-		send_sms(
-			receiver_list,
+		if not self.send_after and len(first_receivers) <= 10:
+			send_sms(
+				first_receivers,
+				message=cstr(self.message),
+				is_promotional=cint(self.is_promotional),
+				reference_doctype="SMS Center",
+				reference_name="SMS Center",
+				queue=False,
+				priority=0
+			)
+			return
+
+		# larger lists are sent in chunks under the SMS gateway rate limit
+		dispatch_log = create_sms_dispatch_log(
+			chain(first_receivers, receiver_nos),
 			message=cstr(self.message),
 			is_promotional=cint(self.is_promotional),
-			reference_doctype="SMS Center",
-			reference_name="SMS Center",
-			queue=queue,
-			queue_separately=True,
-			send_after=self.send_after,
-			priority=0
+			send_after=self.send_after
 		)
 
-		if queue:
-			frappe.msgprint(_("SMS has been scheduled to send"), indicator="green")
+		frappe.msgprint(_("SMS has been scheduled to send to {0} receivers. See {1}").format(
+			frappe.bold(dispatch_log.total_receivers),
+			frappe.get_desk_link("SMS Dispatch Log", dispatch_log.name)
+		), indicator="green")
+
+
+def parse_receiver_lines(lines):
+	for d in lines:
+		receiver_no = cstr(d)
+		if '|' in receiver_no:
+			receiver_no = receiver_no.split('|')[-1]
+
+		receiver_no = receiver_no.strip()
+		if receiver_no:
+			yield receiver_no
+
+
+def write_query_rows(query, f, chunk_size=10000):
+	"""Streams rows of the query to a csv file using an unbuffered cursor so that rows are never all in memory"""
+	writer = csv.writer(f)
+
+	with frappe.db.unbuffered_cursor():
+		rows = frappe.db.sql(query, as_iterator=True)
+		while True:
+			chunk = list(islice(rows, chunk_size))
+			if not chunk:
+				break
+
+			writer.writerows([(cstr(name), cstr(number)) for name, number in chunk])
+
+
+def get_number_key(number):
+	# numbers are deduplicated as integers which take much less memory than strings
+	digits = re.sub(r"[^0-9]", "", number)
+	return int(digits) if digits else number
+
+
+def get_receiver_list_file_path(token):
+	if not token or not token.isalnum():
+		frappe.throw(_("Invalid Receiver List File"))
+
+	return os.path.join(get_receiver_list_folder(), "receiver_list_{0}.txt".format(token))
+
+
+def get_receiver_list_folder():
+	folder = frappe.get_site_path("private", "sms_center")
+	frappe.create_folder(folder)
+	return folder
+
+
+# called through hooks to remove receiver list files left over from previous days
+def remove_old_receiver_list_files(max_age_in_sec=86400):
+	folder = get_receiver_list_folder()
+	for filename in os.listdir(folder):
+		path = os.path.join(folder, filename)
+		try:
+			if time.time() - os.path.getmtime(path) > max_age_in_sec:
+				os.remove(path)
+		except FileNotFoundError:
+			pass
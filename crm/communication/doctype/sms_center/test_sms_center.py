@@ -2,8 +2,26 @@
 # Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 import unittest
+import os
+from crm.communication.doctype.sms_center.sms_center import get_receiver_list_file_path,\
+	remove_old_receiver_list_files
 
 class TestSMSCenter(unittest.TestCase):
-	pass
+	def test_removed_receiver_list_file(self):
+		token = frappe.generate_hash(length=20)
+		path = get_receiver_list_file_path(token)
+		with open(path, "w") as receiver_file:
+			receiver_file.write("_Test Receiver | 03001234567\n")
+
+		sms_center = frappe.new_doc("SMS Center")
+		sms_center.receiver_list_file = token
+		self.assertEqual(sms_center.get_receiver_nos(), ["03001234567"])
+
+		# old files are removed by the daily job
+		os.utime(path, (0, 0))
+		remove_old_receiver_list_files()
+
+		self.assertFalse(os.path.exists(path))
+		self.assertRaises(frappe.ValidationError, sms_center.get_receiver_nos)
@@ -0,0 +1,28 @@
+// Copyright (c) 2026, ParaLogic and Contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("SMS Dispatch Log", {
+	refresh: function(frm) {
+		if (["Queued", "In Progress"].includes(frm.doc.status)) {
+			frm.add_custom_button(__("Cancel Dispatch"), () => {
+				frappe.confirm(__("Are you sure you want to cancel sending the remaining SMS?"), () => {
+					return frm.call({
+						method: "cancel_dispatch",
+						doc: frm.doc,
+						callback: () => frm.refresh(),
+					});
+				});
+			});
+		}
+
+		if (frm.doc.__onload && frm.doc.__onload.can_resume) {
+			frm.add_custom_button(__("Resume Dispatch"), () => {
+				return frm.call({
+					method: "resume_dispatch",
+					doc: frm.doc,
+					callback: () => frm.refresh(),
+				});
+			});
+		}
+	},
+});
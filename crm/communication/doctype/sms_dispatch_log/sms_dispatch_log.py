@@ -0,0 +1,291 @@
+# Copyright (c) 2026, ParaLogic and Contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, now_datetime, add_to_date
+from frappe.model.document import Document
+from frappe.core.doctype.sms_settings.sms_settings import send_sms
+from itertools import islice
+import time
+
+
+stale_chunk_minutes = 30
+max_sms_dispatch_wait_seconds = 120
+
+
+class SMSDispatchLog(Document):
+	def onload(self):
+		self.set_onload("can_resume", self.status in ("Failed", "Cancelled"))
+
+	@frappe.whitelist()
+	def cancel_dispatch(self):
+		if self.status in ("Completed", "Cancelled"):
+			frappe.throw(_("SMS Dispatch is already {0}").format(_(self.status)))
+
+		frappe.db.sql("""
+			update `tabSMS Dispatch Log Chunk`
+			set status = 'Cancelled'
+			where parent = %s and parenttype = 'SMS Dispatch Log' and status in ('Pending', 'Queued')
+		""", self.name)
+
+		self.db_set("status", "Cancelled")
+		self.reload()
+
+	@frappe.whitelist()
+	def resume_dispatch(self):
+		if self.status not in ("Failed", "Cancelled"):
+			frappe.throw(_("Only Failed or Cancelled SMS Dispatch can be resumed"))
+
+		frappe.db.sql("""
+			update `tabSMS Dispatch Log Chunk`
+			set status = 'Pending', error = null, queued_on = null
+			where parent = %s and parenttype = 'SMS Dispatch Log' and status in ('Failed', 'Cancelled')
+		""", self.name)
+
+		self.db_set("status", "Queued")
+		update_dispatch_progress(self.name)
+		self.reload()
+
+		enqueue_sms_dispatch()
+
+
+def create_sms_dispatch_log(receiver_nos, message, is_promotional=0, send_after=None):
+	"""Creates an SMS Dispatch Log with receivers split into chunks from an iterable of receiver numbers"""
+	chunk_size = cint(frappe.db.get_single_value("CRM Settings", "sms_dispatch_chunk_size")) or 500
+
+	doc = frappe.new_doc("SMS Dispatch Log")
+	doc.message = message
+	doc.is_promotional = cint(is_promotional)
+	doc.send_after = send_after
+
+	receiver_nos = iter(receiver_nos)
+	while True:
+		chunk = list(islice(receiver_nos, chunk_size))
+		if not chunk:
+			break
+
+		doc.append("chunks", {
+			"status": "Pending",
+			"receivers": "\n".join(chunk),
+			"total_receivers": len(chunk),
+		})
+
+	doc.total_receivers = sum(d.total_receivers for d in doc.chunks)
+	doc.insert(ignore_permissions=True)
+
+	if not send_after:
+		enqueue_sms_dispatch()
+
+	return doc
+
+
+def enqueue_sms_dispatch():
+	frappe.enqueue("crm.communication.doctype.sms_dispatch_log.sms_dispatch_log.dispatch_sms_chunks",
+		enqueue_after_commit=True)
+
+
+def dispatch_sms_chunks(wait=0):
+	"""
+	Enqueues pending chunks of SMS Dispatch Logs as long as the SMS gateway rate limit allows.
+	Runs from the scheduler, after every sent chunk and once the rate limit allows the next chunk,
+	only one dispatcher runs at a time
+	"""
+	cache = frappe.cache()
+	if wait:
+		time.sleep(min(flt(wait), max_sms_dispatch_wait_seconds))
+		cache.delete_value("sms_dispatch_scheduled")
+
+	lock = cache.lock(cache.make_key("sms_dispatch_lock"), timeout=600)
+	if not lock.acquire(blocking=False):
+		return
+
+	try:
+		_dispatch_sms_chunks()
+	finally:
+		lock.release()
+
+
+def _dispatch_sms_chunks():
+	rate_limit = cint(frappe.db.get_single_value("CRM Settings", "sms_dispatch_rate_limit")) or 600
+
+	requeue_stale_sms_chunks()
+
+	chunks = frappe.db.sql("""
+		select c.name, c.parent, c.total_receivers
+		from `tabSMS Dispatch Log Chunk` c
+		inner join `tabSMS Dispatch Log` l on l.name = c.parent
+		where c.parenttype = 'SMS Dispatch Log' and c.status = 'Pending'
+			and l.status in ('Queued', 'In Progress')
+			and (l.send_after is null or l.send_after <= %s)
+		order by l.creation, c.idx
+		limit 1000
+	""", now_datetime(), as_dict=1)
+
+	for d in chunks:
+		if not take_sms_dispatch_tokens(d.total_receivers, rate_limit):
+			# dispatch again as soon as the chunk fits instead of waiting for the next scheduler tick
+			schedule_sms_dispatch(get_sms_dispatch_token_wait(d.total_receivers, rate_limit))
+			break
+
+		frappe.db.set_value("SMS Dispatch Log Chunk", d.name, {
+			"status": "Queued",
+			"queued_on": now_datetime(),
+		}, update_modified=False)
+		frappe.db.set_value("SMS Dispatch Log", d.parent, "status", "In Progress", update_modified=False)
+
+		frappe.enqueue("crm.communication.doctype.sms_dispatch_log.sms_dispatch_log.send_sms_chunk",
+			dispatch_log=d.parent, chunk=d.name, enqueue_after_commit=True)
+
+	frappe.db.commit()
+
+
+def schedule_sms_dispatch(wait):
+	"""Enqueues a dispatcher that waits for the token bucket to refill unless one is already waiting"""
+	cache = frappe.cache()
+	if not cache.set(cache.make_key("sms_dispatch_scheduled"), 1, ex=cint(wait) + 60, nx=True):
+		return
+
+	frappe.enqueue("crm.communication.doctype.sms_dispatch_log.sms_dispatch_log.dispatch_sms_chunks",
+		wait=wait, enqueue_after_commit=True)
+
+
+def requeue_stale_sms_chunks():
+	# chunks queued long ago were lost by the workers and are sent again,
+	# a job still waiting for such a chunk will find it no longer Queued once the requeued job starts sending it
+	frappe.db.sql("""
+		update `tabSMS Dispatch Log Chunk`
+		set status = 'Pending'
+		where parenttype = 'SMS Dispatch Log' and status = 'Queued' and queued_on < %s
+	""", add_to_date(now_datetime(), minutes=-stale_chunk_minutes))
+
+	# chunks whose job died while sending may have been partly sent so they are failed to be resumed manually
+	frappe.db.sql("""
+		update `tabSMS Dispatch Log Chunk`
+		set status = 'Failed', error = %s
+		where parenttype = 'SMS Dispatch Log' and status = 'Sending' and queued_on < %s
+	""", (_("Sending timed out"), add_to_date(now_datetime(), minutes=-2 * stale_chunk_minutes)))
+
+
+def take_sms_dispatch_tokens(count, rate_limit):
+	"""
+	Token bucket refilled at rate_limit messages per minute holding at most a minute's worth of messages.
+	Returns True if count tokens were taken. A chunk larger than the bucket is allowed when the bucket is full
+	"""
+	cache = frappe.cache()
+	tokens = cache.hget("sms_dispatch_token_bucket", "tokens")
+	timestamp = cache.hget("sms_dispatch_token_bucket", "timestamp")
+
+	now = time.time()
+	capacity = flt(rate_limit)
+	tokens = capacity if tokens is None else flt(tokens)
+	timestamp = now if timestamp is None else flt(timestamp)
+
+	tokens = min(capacity, tokens + (now - timestamp) * capacity / 60)
+
+	taken = tokens >= min(count, capacity)
+	if taken:
+		tokens -= count
+
+	cache.hset("sms_dispatch_token_bucket", "tokens", tokens)
+	cache.hset("sms_dispatch_token_bucket", "timestamp", now)
+
+	return taken
+
+
+def get_sms_dispatch_token_wait(count, rate_limit):
+	"""Returns seconds until the token bucket holds enough tokens for count messages"""
+	capacity = flt(rate_limit)
+	tokens = flt(frappe.cache().hget("sms_dispatch_token_bucket", "tokens"))
+
+	return max(0, (min(count, capacity) - tokens) / capacity * 60)
+
+
+def send_sms_chunk(dispatch_log, chunk):
+	log = frappe.db.get_value("SMS Dispatch Log", dispatch_log, ["status", "message", "is_promotional"], as_dict=1)
+	if not log or log.status == "Cancelled":
+		return
+
+	if not start_sending_sms_chunk(chunk):
+		return
+
+	chunk_doc = frappe.db.get_value("SMS Dispatch Log Chunk", chunk, ["status", "receivers"], as_dict=1)
+
+	try:
+		send_sms(
+			chunk_doc.receivers.split("\n"),
+			message=log.message,
+			is_promotional=cint(log.is_promotional),
+			reference_doctype="SMS Dispatch Log",
+			reference_name=dispatch_log,
+			queue=False,
+		)
+	except Exception:
+		frappe.db.rollback()
+		frappe.db.set_value("SMS Dispatch Log Chunk", chunk, {
+			"status": "Failed",
+			"error": frappe.get_traceback(),
+		}, update_modified=False)
+	else:
+		frappe.db.set_value("SMS Dispatch Log Chunk", chunk, {
+			"status": "Sent",
+			"sent_on": now_datetime(),
+			"error": None,
+		}, update_modified=False)
+
+	update_dispatch_progress(dispatch_log)
+	frappe.db.commit()
+
+	enqueue_sms_dispatch()
+
+
+def start_sending_sms_chunk(chunk):
+	"""
+	Moves a Queued chunk to Sending and returns True.
+	The chunk row is locked so that only one of the jobs enqueued for a chunk sends it
+	"""
+	status = frappe.db.sql("""
+		select status
+		from `tabSMS Dispatch Log Chunk`
+		where name = %s
+		for update
+	""", chunk)
+
+	if not status or status[0][0] != "Queued":
+		frappe.db.commit()
+		return False
+
+	frappe.db.sql("""
+		update `tabSMS Dispatch Log Chunk`
+		set status = 'Sending'
+		where name = %s and status = 'Queued'
+	""", chunk)
+	frappe.db.commit()
+
+	return True
+
+
+def update_dispatch_progress(dispatch_log):
+	counts = frappe.db.sql("""
+		select status, sum(total_receivers) as total_receivers
+		from `tabSMS Dispatch Log Chunk`
+		where parent = %s and parenttype = 'SMS Dispatch Log'
+		group by status
+	""", dispatch_log)
+	counts = {status: cint(total_receivers) for status, total_receivers in counts}
+
+	log_status = frappe.db.get_value("SMS Dispatch Log", dispatch_log, "status")
+	if log_status == "Cancelled":
+		status = "Cancelled"
+	elif counts.get("Pending") or counts.get("Queued") or counts.get("Sending"):
+		status = "In Progress" if len(counts) > 1 or not counts.get("Pending") else "Queued"
+	elif counts.get("Failed"):
+		status = "Failed"
+	else:
+		status = "Completed"
+
+	frappe.db.set_value("SMS Dispatch Log", dispatch_log, {
+		"status": status,
+		"sent_receivers": counts.get("Sent", 0),
+		"failed_receivers": counts.get("Failed", 0),
+	}, update_modified=False)
@@ -0,0 +1,63 @@
+# Copyright (c) 2026, ParaLogic and Contributors
+# See license.txt
+
+import frappe
+import unittest
+from unittest.mock import patch
+from frappe.utils import now_datetime
+from crm.communication.doctype.sms_dispatch_log.sms_dispatch_log import take_sms_dispatch_tokens,\
+	create_sms_dispatch_log, send_sms_chunk, dispatch_sms_chunks
+
+
+class TestSMSDispatchLog(unittest.TestCase):
+	def setUp(self):
+		frappe.cache().delete_value(["sms_dispatch_token_bucket", "sms_dispatch_scheduled"])
+
+	def tearDown(self):
+		frappe.cache().delete_value(["sms_dispatch_token_bucket", "sms_dispatch_scheduled"])
+		frappe.db.rollback()
+
+	def test_drained_token_bucket_refuses(self):
+		self.assertTrue(take_sms_dispatch_tokens(60, 60))
+		self.assertFalse(take_sms_dispatch_tokens(10, 60))
+
+	def test_token_bucket_allows_within_capacity(self):
+		self.assertTrue(take_sms_dispatch_tokens(20, 60))
+		self.assertTrue(take_sms_dispatch_tokens(20, 60))
+		self.assertFalse(take_sms_dispatch_tokens(30, 60))
+
+	def test_chunk_enqueued_twice_is_sent_once(self):
+		with patch("crm.communication.doctype.sms_dispatch_log.sms_dispatch_log.enqueue_sms_dispatch"):
+			dispatch_log = create_sms_dispatch_log(["03001234567", "03007654321"], "Test Message",
+				send_after=now_datetime())
+
+		chunk = dispatch_log.chunks[0].name
+		frappe.db.set_value("SMS Dispatch Log Chunk", chunk, {"status": "Queued", "queued_on": now_datetime()})
+
+		with patch("crm.communication.doctype.sms_dispatch_log.sms_dispatch_log.send_sms") as send_sms,\
+				patch("crm.communication.doctype.sms_dispatch_log.sms_dispatch_log.enqueue_sms_dispatch"):
+			send_sms_chunk(dispatch_log.name, chunk)
+			send_sms_chunk(dispatch_log.name, chunk)
+
+		self.assertEqual(send_sms.call_count, 1)
+		self.assertEqual(frappe.db.get_value("SMS Dispatch Log Chunk", chunk, "status"), "Sent")
+		self.assertEqual(frappe.db.get_value("SMS Dispatch Log", dispatch_log.name, "status"), "Completed")
+
+	def test_dispatch_scheduled_when_bucket_is_drained(self):
+		with patch("crm.communication.doctype.sms_dispatch_log.sms_dispatch_log.enqueue_sms_dispatch"):
+			dispatch_log = create_sms_dispatch_log(["0300{0:07d}".format(i) for i in range(300)], "Test Message")
+
+		rate_limit = frappe.db.get_single_value("CRM Settings", "sms_dispatch_rate_limit") or 600
+		self.assertTrue(take_sms_dispatch_tokens(rate_limit, rate_limit))
+
+		with patch("frappe.enqueue") as enqueue, patch.object(frappe.db, "commit"):
+			dispatch_sms_chunks()
+			dispatch_sms_chunks()
+
+		# chunk is not queued but a single dispatcher is scheduled for when it fits
+		self.assertEqual(frappe.db.get_value("SMS Dispatch Log Chunk", dispatch_log.chunks[0].name, "status"), "Pending")
+		self.assertEqual(enqueue.call_count, 1)
+		self.assertEqual(enqueue.call_args.args[0],
+			"crm.communication.doctype.sms_dispatch_log.sms_dispatch_log.dispatch_sms_chunks")
+		self.assertGreater(enqueue.call_args.kwargs['wait'], 0)
+		self.assertLessEqual(enqueue.call_args.kwargs['wait'], 60)
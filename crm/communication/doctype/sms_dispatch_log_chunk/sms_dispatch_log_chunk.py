@@ -0,0 +1,8 @@
+# Copyright (c) 2026, ParaLogic and Contributors
+# For license information, please see license.txt
+
+from frappe.model.document import Document
+
+
+class SMSDispatchLogChunk(Document):
+	pass
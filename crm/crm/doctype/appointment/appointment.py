@@ -11,22 +11,34 @@ from frappe.utils import (
 )
 from crm.crm.doctype.sales_person.sales_person import get_sales_person_from_user
 from frappe.desk.form.assign_to import add as add_assignment, clear as clear_assignments, close_all_assignments
-from frappe.contacts.doctype.address.address import get_default_address
-from frappe.contacts.doctype.contact.contact import get_default_contact, get_all_contact_nos
-from crm.crm.utils import get_contact_details, get_address_display
+from frappe.contacts.doctype.contact.contact import get_all_contact_nos
+from crm.crm.party import get_party_details, get_contact_details, needs_party_details_refresh
 from frappe.core.doctype.sms_settings.sms_settings import enqueue_template_sms
 from frappe.core.doctype.notification_count.notification_count import get_all_notification_count
 from frappe.model.mapper import get_mapped_doc
 import datetime
+import bisect
 import json
 
 
+max_timeslot_date_range_days = 62
+appointment_occupancy_cache_expiry = 600
+appointment_reminder_batch_size = 100
+appointment_reminder_checkpoint_expiry = 2 * 24 * 3600
+appointment_reminder_requeue_minutes = 30
+
+
 class Appointment(StatusUpdater):
 	force_party_fields = [
 		'customer_name', 'tax_id', 'tax_cnic', 'tax_strn',
 		'address_display', 'contact_display', 'contact_email', 'secondary_contact_display',
 	]
 
+	party_type_field = 'appointment_for'
+	party_link_fields = [
+		'appointment_for', 'party_name', 'contact_person', 'customer_address', 'secondary_contact_person',
+	]
+
 	def get_feed(self):
 		return _("For {0}").format(self.get("customer_name") or self.get('party_name'))
 
@@ -67,6 +79,7 @@ class Appointment(StatusUpdater):
 		self.update_opportunity_status()
 		self.auto_assign()
 		self.create_calendar_event(update=True)
+		self.clear_occupancy_cache()
 		self.send_appointment_confirmation_notification()
 
 	def on_cancel(self):
@@ -74,11 +87,13 @@ class Appointment(StatusUpdater):
 		self.validate_next_document_on_cancel()
 		self.update_opportunity_status()
 		self.auto_unassign()
+		self.clear_occupancy_cache()
 		self.send_appointment_cancellation_notification()
 
 	def after_delete(self):
 		self.update_previous_appointment()
 		self.update_opportunity_status()
+		self.clear_occupancy_cache()
 
 	@classmethod
 	def get_allowed_party_types(cls):
@@ -142,6 +157,9 @@ class Appointment(StatusUpdater):
 			self.scheduled_day_of_week = None
 
 	def set_customer_details(self):
+		if not needs_party_details_refresh(self, self.party_link_fields):
+			return
+
 		customer_details = get_customer_details(self.as_dict())
 		for k, v in customer_details.items():
 			if self.meta.has_field(k) and (not self.get(k) or k in self.force_party_fields):
@@ -194,8 +212,9 @@ class Appointment(StatusUpdater):
 				raise_exception=appointment_type_doc.validate_availability)
 
 		# check if already booked
+		# always counted from the database since the cache may not have seen a booking being committed
 		appointments_in_same_slot = count_appointments_in_same_slot(self.scheduled_dt, self.end_dt,
-			self.appointment_type, appointment=self.name if not self.is_new() else None)
+			self.appointment_type, appointment=self.name if not self.is_new() else None, use_cache=False)
 		no_of_agents = cint(appointment_type_doc.number_of_agents)
 
 		if no_of_agents and appointments_in_same_slot >= no_of_agents:
@@ -323,16 +342,15 @@ class Appointment(StatusUpdater):
 			})
 			return
 
-		available_agents = get_agents_sorted_by_asc_workload(getdate(self.scheduled_dt), self.appointment_type)
+		available_agent = get_least_busy_available_agent(self.appointment_type, self.scheduled_dt, self.end_dt,
+			appointment=self.name)
 
-		for agent in available_agents:
-			if check_agent_availability(agent, self.scheduled_dt, self.end_dt):
-				add_assignment({
-					'doctype': self.doctype,
-					'name': self.name,
-					'assign_to': agent
-				})
-				break
+		if available_agent:
+			add_assignment({
+				'doctype': self.doctype,
+				'name': self.name,
+				'assign_to': available_agent
+			})
 
 	def get_assignee_from_latest_opportunity(self):
 		if not self.appointment_for or not self.party_name:
@@ -394,6 +412,17 @@ class Appointment(StatusUpdater):
 					'is_closed': self.is_closed,
 				}, update_modified=update_modified)
 
+			if previous_status != self.status:
+				self.clear_occupancy_cache()
+
+	def clear_occupancy_cache(self):
+		if self.appointment_type and self.scheduled_dt:
+			args = (self.appointment_type, self.scheduled_dt, self.end_dt or self.scheduled_dt)
+
+			# clear again after commit in case a concurrent request reloaded the cache before this commit
+			clear_appointment_occupancy_cache(*args)
+			frappe.db.after_commit.add(lambda: clear_appointment_occupancy_cache(*args))
+
 	def is_appointment_closed(self):
 		return cint(self.is_closed)
 
@@ -497,7 +526,10 @@ class Appointment(StatusUpdater):
 		return True
 
 	def update_opportunity_status(self):
+		from crm.crm.doctype.opportunity.opportunity import clear_opportunity_status_memo
+
 		if self.opportunity:
+			clear_opportunity_status_memo(self.opportunity)
 			doc = frappe.get_doc("Opportunity", self.opportunity)
 			doc.set_status(update=True)
 			doc.update_lead_status()
@@ -520,52 +552,66 @@ class Appointment(StatusUpdater):
 			"disable_automated_notifications"))
 
 
-def get_agents_sorted_by_asc_workload(date, appointment_type):
-	date = getdate(date)
+def on_doctype_update():
+	frappe.db.add_index("Appointment", ["appointment_type", "docstatus", "scheduled_dt", "end_dt"])
+	frappe.db.add_index("Appointment", ["appointment_type", "docstatus", "appointment_duration"])
+	frappe.db.add_index("Appointment", ["scheduled_date", "docstatus"])
+
 
+def get_least_busy_available_agent(appointment_type, scheduled_dt, end_dt, appointment=None):
 	agents = get_agents_list(appointment_type)
 	if not agents:
-		return []
+		return None
 
-	appointments = frappe.get_all('Appointment', fields=['name', '_assign'],
-		filters={'scheduled_date': date, 'docstatus': 1, 'status': ['!=', 'Rescheduled']})
-	if not appointments:
-		return agents
+	scheduled_dt = get_datetime(scheduled_dt)
+	end_dt = get_datetime(end_dt or scheduled_dt)
+	date = getdate(scheduled_dt)
 
 	agent_booked_dict = {agent: 0 for agent in agents}
+	busy_agents = set()
 
-	for appointment in appointments:
-		assigned_to = frappe.parse_json(appointment._assign or '[]')
-		if not assigned_to:
+	# include the previous day for appointments continuing past midnight
+	for d in get_agent_assignments(agents, add_days(date, -1), getdate(end_dt)):
+		if d.name == appointment:
 			continue
 
-		assigned_to = assigned_to[0]
-		if assigned_to not in agents:
-			continue
+		if getdate(d.scheduled_date) == date:
+			agent_booked_dict[d.allocated_to] += 1
 
-		agent_booked_dict[assigned_to] += 1
+		if scheduled_dt < get_datetime(d.end_dt) and end_dt > get_datetime(d.scheduled_dt):
+			busy_agents.add(d.allocated_to)
 
-	agent_booked_list = list(agent_booked_dict.items())
-	sorted_agent_booked_list = sorted(agent_booked_list, key=lambda d: d[1])
-	return [d[0] for d in sorted_agent_booked_list]
+	available_agents = [agent for agent in agents if agent not in busy_agents]
+	if not available_agents:
+		return None
+
+	return min(available_agents, key=lambda agent: agent_booked_dict[agent])
 
 
 def get_agents_list(appointment_type):
 	if not appointment_type:
 		return []
 
-	appointment_type_doc = frappe.get_cached_doc('Appointment Type')
+	appointment_type_doc = frappe.get_cached_doc('Appointment Type', appointment_type)
 	return appointment_type_doc.get_agents()
 
 
-def check_agent_availability(agent, scheduled_dt, end_dt):
-	appointments = get_appointments_in_same_slot(scheduled_dt, end_dt)
-	for appointment in appointments:
-		assignments = frappe.parse_json(appointment._assign or '[]')
-		if agent in assignments:
-			return False
+def get_agent_assignments(agents, from_date, to_date):
+	if not agents:
+		return []
 
-	return True
+	return frappe.db.sql("""
+		select a.name, a.scheduled_date, a.scheduled_dt, a.end_dt, t.allocated_to
+		from `tabAppointment` a
+		inner join `tabToDo` t on t.reference_type = 'Appointment' and t.reference_name = a.name
+		where a.docstatus = 1 and a.status != 'Rescheduled'
+			and a.scheduled_date between %(from_date)s and %(to_date)s
+			and t.status = 'Open' and t.allocated_to in %(agents)s
+	""", {
+		'from_date': getdate(from_date),
+		'to_date': getdate(to_date),
+		'agents': agents,
+	}, as_dict=1)
 
 
 @frappe.whitelist()
@@ -587,19 +633,8 @@ def get_appointment_timeslots(scheduled_date, appointment_type, appointment=None
 	no_of_agents = cint(appointment_type_doc.number_of_agents)
 
 	if timeslots:
-		for timeslot_start, timeslot_end in timeslots:
-			appointments_in_same_slots = count_appointments_in_same_slot(timeslot_start, timeslot_end, appointment_type,
-				appointment)
-
-			timeslot_data = {
-				'timeslot_start': timeslot_start,
-				'timeslot_end': timeslot_end,
-				'timeslot_duration': round((timeslot_end - timeslot_start) / datetime.timedelta(minutes=1)),
-				'number_of_agents': no_of_agents,
-				'booked': appointments_in_same_slots,
-				'available': max(0, no_of_agents - appointments_in_same_slots)
-			}
-			out.timeslots.append(timeslot_data)
+		booked_counts = count_appointments_in_timeslots(timeslots, appointment_type, appointment)
+		out.timeslots = get_timeslots_data(timeslots, booked_counts, no_of_agents)
 
 	elif timeslots is None:
 		out.timeslots = None
@@ -607,9 +642,188 @@ def get_appointment_timeslots(scheduled_date, appointment_type, appointment=None
 	return out
 
 
-def count_appointments_in_same_slot(start_dt, end_dt, appointment_type, appointment=None):
-	appointments = get_appointments_in_same_slot(start_dt, end_dt, appointment_type, appointment=appointment)
-	return len(appointments) if appointments else 0
+@frappe.whitelist()
+def get_appointment_timeslots_for_date_range(from_date, to_date, appointment_types, appointment=None):
+	if isinstance(appointment_types, str):
+		appointment_types = json.loads(appointment_types) if appointment_types.startswith("[") else [appointment_types]
+
+	out = frappe._dict()
+
+	if not from_date or not to_date or not appointment_types:
+		return out
+
+	from_date = getdate(from_date)
+	to_date = getdate(to_date)
+
+	no_of_days = date_diff(to_date, from_date) + 1
+	if no_of_days <= 0:
+		frappe.throw(_("To Date cannot be before From Date"))
+	if no_of_days > max_timeslot_date_range_days:
+		frappe.throw(_("Cannot get appointment timeslots for more than {0} days")
+			.format(max_timeslot_date_range_days))
+
+	dates = [add_days(from_date, i) for i in range(no_of_days)]
+
+	for appointment_type in appointment_types:
+		appointment_type_doc = frappe.get_cached_doc("Appointment Type", appointment_type)
+		no_of_agents = cint(appointment_type_doc.number_of_agents)
+
+		type_out = out[appointment_type] = frappe._dict()
+		date_timeslots = {}
+
+		for date in dates:
+			date_out = type_out[str(date)] = frappe._dict({
+				'holiday': appointment_type_doc.is_holiday(date),
+				'timeslots': []
+			})
+
+			timeslots = appointment_type_doc.get_timeslots(date)
+			if timeslots:
+				date_timeslots[str(date)] = timeslots
+			elif timeslots is None:
+				date_out.timeslots = None
+
+		# count all timeslots in the date range together so that only one query is run per appointment type
+		all_timeslots = [timeslot for timeslots in date_timeslots.values() for timeslot in timeslots]
+		booked_counts = count_appointments_in_timeslots(all_timeslots, appointment_type, appointment)
+
+		i = 0
+		for date_str, timeslots in date_timeslots.items():
+			type_out[date_str].timeslots = get_timeslots_data(timeslots, booked_counts[i:i + len(timeslots)],
+				no_of_agents)
+			i += len(timeslots)
+
+	return out
+
+
+def get_timeslots_data(timeslots, booked_counts, no_of_agents):
+	timeslots_data = []
+	for (timeslot_start, timeslot_end), appointments_in_same_slots in zip(timeslots, booked_counts):
+		timeslots_data.append({
+			'timeslot_start': timeslot_start,
+			'timeslot_end': timeslot_end,
+			'timeslot_duration': round((timeslot_end - timeslot_start) / datetime.timedelta(minutes=1)),
+			'number_of_agents': no_of_agents,
+			'booked': appointments_in_same_slots,
+			'available': max(0, no_of_agents - appointments_in_same_slots)
+		})
+
+	return timeslots_data
+
+
+def count_appointments_in_same_slot(start_dt, end_dt, appointment_type, appointment=None, use_cache=True):
+	if not start_dt or not end_dt:
+		return 0
+
+	return count_appointments_in_timeslots([(start_dt, end_dt)], appointment_type, appointment, use_cache=use_cache)[0]
+
+
+def count_appointments_in_timeslots(timeslots, appointment_type, appointment=None, use_cache=True):
+	"""
+	Returns the number of overlapping appointments for each (start, end) timeslot
+	using cached day occupancy or the database if use_cache is False
+	"""
+	if not timeslots:
+		return []
+
+	range_start = min(get_datetime(timeslot_start) for timeslot_start, timeslot_end in timeslots)
+	range_end = max(get_datetime(timeslot_end) for timeslot_start, timeslot_end in timeslots)
+
+	if use_cache:
+		appointments = get_booked_appointment_intervals(appointment_type, getdate(range_start), getdate(range_end))
+		if appointment:
+			appointments = [d for d in appointments if d.name != appointment]
+	else:
+		appointments = get_appointments_in_same_slot(range_start, range_end, appointment_type, appointment)
+
+	for d in appointments:
+		d.scheduled_dt = get_datetime(d.scheduled_dt)
+		d.end_dt = get_datetime(d.end_dt)
+
+	# An appointment overlaps timeslot (start, end) if scheduled_dt < end and end_dt > start
+	# Since scheduled_dt <= end_dt, appointments with end_dt <= start are a subset of those with scheduled_dt < end
+	scheduled_dts = sorted(d.scheduled_dt for d in appointments)
+	end_dts = sorted(d.end_dt for d in appointments)
+
+	counts = []
+	for timeslot_start, timeslot_end in timeslots:
+		started_before_end = bisect.bisect_left(scheduled_dts, get_datetime(timeslot_end))
+		ended_before_start = bisect.bisect_right(end_dts, get_datetime(timeslot_start))
+		counts.append(started_before_end - ended_before_start)
+
+	return counts
+
+
+def get_booked_appointment_intervals(appointment_type, from_date, to_date):
+	"""Returns booked appointments overlapping the date range from cache, loading uncached dates with a single query"""
+	from_date = getdate(from_date)
+	to_date = getdate(to_date)
+	dates = [add_days(from_date, i) for i in range(date_diff(to_date, from_date) + 1)]
+
+	intervals = {}
+	missing_dates = []
+	for date in dates:
+		cached = frappe.cache().get_value(get_appointment_occupancy_cache_key(appointment_type, date))
+		if cached is None:
+			missing_dates.append(date)
+		else:
+			intervals.update({d[0]: d for d in cached})
+
+	if missing_dates:
+		occupancy = load_appointment_occupancy(appointment_type, missing_dates[0], missing_dates[-1])
+		for date in missing_dates:
+			intervals.update({d[0]: d for d in occupancy[date]})
+
+	return [frappe._dict({'name': name, 'scheduled_dt': scheduled_dt, 'end_dt': end_dt})
+		for name, scheduled_dt, end_dt in intervals.values()]
+
+
+def load_appointment_occupancy(appointment_type, from_date, to_date):
+	"""Loads and caches booked appointment intervals for each date in the range"""
+	from_date = getdate(from_date)
+	to_date = getdate(to_date)
+	dates = [add_days(from_date, i) for i in range(date_diff(to_date, from_date) + 1)]
+
+	appointments = get_appointments_in_same_slot(combine_datetime(from_date, get_time("00:00:00")),
+		combine_datetime(add_days(to_date, 1), get_time("00:00:00")), appointment_type)
+
+	occupancy = {date: [] for date in dates}
+	for d in appointments:
+		scheduled_dt = get_datetime(d.scheduled_dt)
+		end_dt = get_datetime(d.end_dt)
+
+		date = getdate(scheduled_dt)
+		while date <= getdate(end_dt):
+			day_start = combine_datetime(date, get_time("00:00:00"))
+			if date in occupancy and scheduled_dt < add_days(day_start, 1) and end_dt > day_start:
+				occupancy[date].append((d.name, scheduled_dt, end_dt))
+			date = add_days(date, 1)
+
+	for date, intervals in occupancy.items():
+		frappe.cache().set_value(get_appointment_occupancy_cache_key(appointment_type, date), intervals,
+			expires_in_sec=appointment_occupancy_cache_expiry)
+
+	return occupancy
+
+
+def clear_appointment_occupancy_cache(appointment_type, start_dt, end_dt):
+	date = getdate(start_dt)
+	while date <= getdate(end_dt):
+		frappe.cache().delete_value(get_appointment_occupancy_cache_key(appointment_type, date))
+		date = add_days(date, 1)
+
+
+def get_appointment_occupancy_cache_key(appointment_type, date):
+	return "appointment_occupancy:{0}:{1}".format(appointment_type, getdate(date))
+
+
+def reconcile_appointment_occupancy_cache():
+	frappe.cache().delete_keys("appointment_occupancy:")
+
+	from_date = getdate(today())
+	for d in frappe.get_all("Appointment Type", fields=['name', 'advance_booking_days']):
+		advance_booking_days = cint(d.advance_booking_days) or 30
+		load_appointment_occupancy(d.name, from_date, add_days(from_date, advance_booking_days))
 
 
 def get_appointments_in_same_slot(start_dt, end_dt, appointment_type, appointment=None):
@@ -620,14 +834,20 @@ def get_appointments_in_same_slot(start_dt, end_dt, appointment_type, appointmen
 	if appointment:
 		exclude_condition = "and name != %(appointment)s"
 
+	# bound scheduled_dt from below using the longest appointment duration so that the index range scan stays narrow
+	max_duration = get_max_appointment_duration(appointment_type)
+	window_start_dt = start_dt - datetime.timedelta(minutes=max_duration)
+
 	appointments = frappe.db.sql("""
-		select name, _assign
+		select name, _assign, scheduled_dt, end_dt
 		from `tabAppointment`
 		where docstatus = 1 and status != 'Rescheduled' and appointment_type = %(appointment_type)s
-			and %(start_dt)s < end_dt AND %(end_dt)s > scheduled_dt {0}
+			and scheduled_dt >= %(window_start_dt)s and scheduled_dt < %(end_dt)s
+			and %(start_dt)s < end_dt {0}
 	""".format(exclude_condition), {
 		'start_dt': start_dt,
 		'end_dt': end_dt,
+		'window_start_dt': window_start_dt,
 		'appointment_type': appointment_type,
 		'appointment': appointment
 	}, as_dict=1)
@@ -635,6 +855,17 @@ def get_appointments_in_same_slot(start_dt, end_dt, appointment_type, appointmen
 	return appointments
 
 
+def get_max_appointment_duration(appointment_type):
+	# served from the (appointment_type, docstatus, appointment_duration) index
+	max_duration = frappe.db.sql("""
+		select max(appointment_duration)
+		from `tabAppointment`
+		where appointment_type = %s and docstatus = 1
+	""", appointment_type)
+
+	return max(0, cint(max_duration[0][0] if max_duration else 0))
+
+
 def auto_mark_missed():
 	auto_mark_missed_days = cint(frappe.get_cached_value("Appointment Booking Settings", None, "auto_mark_missed_days"))
 	if auto_mark_missed_days > 0:
@@ -655,40 +886,14 @@ def get_customer_details(args):
 	args = frappe._dict(args)
 	out = frappe._dict()
 
-	if not args.appointment_for or not args.party_name:
-		party = frappe._dict()
-	else:
+	if args.appointment_for and args.party_name:
 		appointment_controler = get_controller("Appointment")
 		appointment_controler.validate_appointment_for(args.appointment_for)
 
-		party = frappe.get_cached_doc(args.appointment_for, args.party_name)
-
-	# Customer Name
-	if party.doctype == "Lead":
-		out.customer_name = party.company_name or party.lead_name
-	else:
-		out.customer_name = party.get("customer_name")
-
-	# Tax IDs
-	out.tax_id = party.get('tax_id')
-	out.tax_cnic = party.get('tax_cnic')
-	out.tax_strn = party.get('tax_strn')
-
-	lead = party if party.doctype == "Lead" else None
-
-	# Address
-	out.customer_address = args.customer_address
-	if not out.customer_address and party.doctype != "Lead":
-		out.customer_address = get_default_address(party.doctype, party.name)
-
-	out.address_display = get_address_display(out.customer_address, lead=lead)
-
-	# Contact
-	out.contact_person = args.contact_person
-	if not out.contact_person and party.doctype != "Lead":
-		out.contact_person = get_default_contact(party.doctype, party.name)
-
-	out.update(get_contact_details(out.contact_person, lead=lead))
+	party_details = get_party_details(args.appointment_for, args.party_name,
+		contact_person=args.contact_person, customer_address=args.customer_address)
+	party = party_details.pop('party')
+	out.update(party_details)
 
 	out.secondary_contact_person = args.secondary_contact_person
 	secondary_contact_details = get_contact_details(out.secondary_contact_person)
@@ -760,11 +965,62 @@ def send_appointment_reminder_notifications():
 
 	appointments_to_remind = get_appointments_for_reminder_notification(reminder_date)
 
+	checkpoint_key = get_appointment_reminder_checkpoint_key(reminder_date)
+	checkpoint = get_appointment_reminder_checkpoint(reminder_date)
+	pending_appointments = [name for name in appointments_to_remind if checkpoint.get(name) != "Done"]
+
+	# all reminders for the day have been processed
+	if not pending_appointments:
+		frappe.db.set_global("appointment_reminder_notification_last_sent_date", reminder_date)
+		frappe.cache().delete_value(checkpoint_key)
+		return
+
+	# do not queue again if queued recently and a previous run is still in progress
+	requeue_before = now_dt - datetime.timedelta(minutes=appointment_reminder_requeue_minutes)
+	appointments_to_queue = [name for name in pending_appointments
+		if not checkpoint.get(name) or get_datetime(checkpoint.get(name)) <= requeue_before]
+
+	for i in range(0, len(appointments_to_queue), appointment_reminder_batch_size):
+		batch = appointments_to_queue[i:i + appointment_reminder_batch_size]
+		for name in batch:
+			frappe.cache().hset(checkpoint_key, name, str(now_dt))
+		expire_appointment_reminder_checkpoint(reminder_date)
+
+		frappe.enqueue("crm.crm.doctype.appointment.appointment.send_appointment_reminder_notification_batch",
+			queue="long", appointments=batch, reminder_date=reminder_date)
+
+
+def send_appointment_reminder_notification_batch(appointments, reminder_date):
+	checkpoint_key = get_appointment_reminder_checkpoint_key(reminder_date)
+
+	# only remind appointments that are still due and not reminded by an overlapping batch
+	appointments_to_remind = get_appointments_for_reminder_notification(reminder_date, appointments=appointments)
+
 	for name in appointments_to_remind:
+		if frappe.cache().hget(checkpoint_key, name) == "Done":
+			continue
+
 		doc = frappe.get_doc("Appointment", name)
 		doc.send_appointment_reminder_notification()
+		frappe.db.commit()
+
+		frappe.cache().hset(checkpoint_key, name, "Done")
+
+
+def get_appointment_reminder_checkpoint_key(reminder_date):
+	return "appointment_reminder_checkpoint:{0}".format(getdate(reminder_date))
+
+
+def get_appointment_reminder_checkpoint(reminder_date):
+	checkpoint = frappe.cache().hgetall(get_appointment_reminder_checkpoint_key(reminder_date)) or {}
+	return {frappe.safe_decode(name): value for name, value in checkpoint.items()}
+
 
-	frappe.db.set_global("appointment_reminder_notification_last_sent_date", reminder_date)
+def expire_appointment_reminder_checkpoint(reminder_date):
+	# a day that never completes should not leave its checkpoint behind
+	cache = frappe.cache()
+	cache.expire(cache.make_key(get_appointment_reminder_checkpoint_key(reminder_date)),
+		appointment_reminder_checkpoint_expiry)
 
 
 def automated_reminder_enabled():
@@ -804,7 +1060,9 @@ def get_appointments_for_reminder_notification(reminder_date=None, appointments=
 		from `tabAppointment` a
 		left join `tabNotification Count` n on n.reference_doctype = 'Appointment' and n.reference_name = a.name
 			and n.notification_type = 'Appointment Reminder' and n.notification_medium = 'SMS'
+		left join `tabAppointment Source` s on s.name = a.appointment_source
 		where a.docstatus = 1
+			and ifnull(s.disable_automated_notifications, 0) = 0
 			and a.status = 'Open'
 			and a.scheduled_date = %(appointment_date)s
 			and %(reminder_dt)s < a.scheduled_dt
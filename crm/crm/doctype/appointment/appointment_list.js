@@ -27,6 +27,10 @@ frappe.listview_settings['Appointment'] = {
 	},
 
 	onload: function(listview) {
+		listview.page.add_action_item(__("Update Party Details"), function() {
+			listview.call_for_selected_items("crm.crm.party.update_party_details", {"doctype": "Appointment"});
+		});
+
 		if (listview.page.fields_dict.appointment_for) {
 			listview.page.fields_dict.appointment_for.get_query = function() {
 				return {
@@ -5,6 +5,11 @@
 import frappe
 import unittest
 import datetime
+from unittest.mock import patch, MagicMock
+from crm.crm.doctype.appointment.appointment import count_appointments_in_timeslots,\
+    get_least_busy_available_agent, count_appointments_in_same_slot, get_appointment_occupancy_cache_key, send_appointment_reminder_notifications,\
+    send_appointment_reminder_notification_batch, get_appointment_reminder_checkpoint_key,\
+    get_appointment_reminder_checkpoint
 
 
 def create_test_lead():
@@ -54,3 +59,172 @@ class TestAppointment(unittest.TestCase):
     def test_lead_linked(self):
         lead = frappe.get_doc('Lead', self.test_lead.name)
         self.assertIsNotNone(lead)
+
+
+class TestAppointmentScheduling(unittest.TestCase):
+    appointment_type = "_Test Appointment Type"
+
+    def test_slot_counts_for_adjacent_and_overlapping_bookings(self):
+        def dt(time):
+            return datetime.datetime.combine(datetime.date(2030, 1, 1), datetime.time.fromisoformat(time))
+
+        booked = [
+            frappe._dict({'name': 'A', 'scheduled_dt': dt("10:00"), 'end_dt': dt("10:30")}),
+            frappe._dict({'name': 'B', 'scheduled_dt': dt("10:30"), 'end_dt': dt("11:00")}),
+            frappe._dict({'name': 'C', 'scheduled_dt': dt("10:15"), 'end_dt': dt("10:45")}),
+        ]
+        timeslots = [
+            (dt("09:30"), dt("10:00")),
+            (dt("10:00"), dt("10:30")),
+            (dt("10:30"), dt("11:00")),
+            (dt("10:20"), dt("10:40")),
+            (dt("11:00"), dt("11:30")),
+        ]
+
+        with patch("crm.crm.doctype.appointment.appointment.get_booked_appointment_intervals",
+                side_effect=lambda *args: [frappe._dict(d) for d in booked]):
+            # appointments ending at a timeslot's start or starting at its end are adjacent, not overlapping
+            self.assertEqual(count_appointments_in_timeslots(timeslots, self.appointment_type), [0, 2, 2, 3, 0])
+
+            # the appointment being validated does not count against itself
+            self.assertEqual(count_appointments_in_timeslots(timeslots, self.appointment_type, appointment='C'),
+                [0, 1, 1, 2, 0])
+
+    def test_occupancy_cache_cleared_after_cancel(self):
+        scheduled_dt = datetime.datetime(2030, 1, 1, 10, 0)
+        end_dt = datetime.datetime(2030, 1, 1, 10, 30)
+        cache_key = get_appointment_occupancy_cache_key(self.appointment_type, scheduled_dt)
+        booked = [("_Test Appointment", scheduled_dt, end_dt)]
+
+        frappe.cache().set_value(cache_key, booked)
+        self.assertEqual(count_appointments_in_same_slot(scheduled_dt, end_dt, self.appointment_type), 1)
+
+        appointment = frappe.get_doc({
+            'doctype': 'Appointment',
+            'appointment_type': self.appointment_type,
+            'scheduled_dt': scheduled_dt,
+            'end_dt': end_dt,
+        })
+        with patch.object(appointment, "db_set"), patch.object(appointment, "validate_next_document_on_cancel"),\
+                patch.object(appointment, "update_opportunity_status"), patch.object(appointment, "auto_unassign"),\
+                patch.object(appointment, "send_appointment_cancellation_notification"):
+            appointment.on_cancel()
+
+        self.assertIsNone(frappe.cache().get_value(cache_key))
+
+        # a concurrent request that reloaded the cache before the cancellation was committed
+        frappe.cache().set_value(cache_key, booked)
+        frappe.db.after_commit.run()
+
+        self.assertIsNone(frappe.cache().get_value(cache_key))
+
+    def test_reminder_batch_not_sent_twice(self):
+        reminder_date = datetime.date(2030, 1, 1)
+        checkpoint_key = get_appointment_reminder_checkpoint_key(reminder_date)
+        frappe.cache().delete_value(checkpoint_key)
+
+        appointment = MagicMock()
+        with patch("crm.crm.doctype.appointment.appointment.get_appointments_for_reminder_notification",
+                return_value=["_Test Appointment"]), patch("frappe.get_doc", return_value=appointment),\
+                patch.object(frappe.db, "commit"):
+            send_appointment_reminder_notification_batch(["_Test Appointment"], reminder_date)
+            send_appointment_reminder_notification_batch(["_Test Appointment"], reminder_date)
+
+        self.assertEqual(appointment.send_appointment_reminder_notification.call_count, 1)
+        self.assertEqual(get_appointment_reminder_checkpoint(reminder_date), {"_Test Appointment": "Done"})
+
+        frappe.cache().delete_value(checkpoint_key)
+
+    def test_reminders_not_queued_twice(self):
+        checkpoint_key = get_appointment_reminder_checkpoint_key(frappe.utils.today())
+        frappe.cache().delete_value(checkpoint_key)
+
+        with patch("crm.crm.doctype.appointment.appointment.automated_reminder_enabled", return_value=True),\
+                patch("crm.crm.doctype.appointment.appointment.get_appointment_reminders_scheduled_time",
+                    return_value=datetime.datetime(2000, 1, 1)),\
+                patch("crm.crm.doctype.appointment.appointment.get_appointments_for_reminder_notification",
+                    return_value=["_Test Appointment 1", "_Test Appointment 2"]),\
+                patch.object(frappe.db, "get_global", return_value=None), patch.object(frappe.db, "set_global"),\
+                patch("frappe.enqueue") as enqueue:
+            send_appointment_reminder_notifications()
+            self.assertEqual(enqueue.call_count, 1)
+            self.assertEqual(enqueue.call_args.kwargs['appointments'], ["_Test Appointment 1", "_Test Appointment 2"])
+
+            # a batch still in progress is not queued again
+            send_appointment_reminder_notifications()
+            self.assertEqual(enqueue.call_count, 1)
+
+            # reminded appointments are not queued again after the requeue timeout
+            frappe.cache().hset(checkpoint_key, "_Test Appointment 1", "Done")
+            frappe.cache().hset(checkpoint_key, "_Test Appointment 2", "2000-01-01 00:00:00")
+            send_appointment_reminder_notifications()
+            self.assertEqual(enqueue.call_count, 2)
+            self.assertEqual(enqueue.call_args.kwargs['appointments'], ["_Test Appointment 2"])
+
+        frappe.cache().delete_value(checkpoint_key)
+
+
+class TestAppointmentAgentAssignment(unittest.TestCase):
+    appointment_type = "_Test Appointment Type"
+    agents = ["agent1@example.com", "agent2@example.com", "agent3@example.com"]
+
+    def get_least_busy_available_agent(self, assignments, scheduled_dt, end_dt, appointment=None):
+        assignments = [frappe._dict({
+            'name': name,
+            'allocated_to': allocated_to,
+            'scheduled_date': scheduled_dt.date(),
+            'scheduled_dt': scheduled_dt,
+            'end_dt': end_dt,
+        }) for name, allocated_to, scheduled_dt, end_dt in assignments]
+
+        with patch("crm.crm.doctype.appointment.appointment.get_agents_list", return_value=self.agents),\
+                patch("crm.crm.doctype.appointment.appointment.get_agent_assignments", return_value=assignments):
+            return get_least_busy_available_agent(self.appointment_type, scheduled_dt, end_dt, appointment)
+
+    def test_agent_with_overlapping_appointment_skipped(self):
+        def dt(time):
+            return datetime.datetime.combine(datetime.date(2030, 1, 1), datetime.time.fromisoformat(time))
+
+        assignments = [
+            ('A1', self.agents[0], dt("10:00"), dt("10:30")),
+            ('B1', self.agents[1], dt("09:00"), dt("09:30")),
+            ('B2', self.agents[1], dt("11:00"), dt("11:30")),
+            ('C1', self.agents[2], dt("09:00"), dt("09:30")),
+            ('C2', self.agents[2], dt("11:00"), dt("11:30")),
+            ('C3', self.agents[2], dt("12:00"), dt("12:30")),
+        ]
+
+        # the least busy agent is booked in the slot
+        self.assertEqual(self.get_least_busy_available_agent(assignments, dt("10:15"), dt("10:45")), self.agents[1])
+
+        # an appointment ending when the slot starts does not overlap it
+        self.assertEqual(self.get_least_busy_available_agent(assignments, dt("10:30"), dt("11:00")), self.agents[0])
+
+    def test_appointment_past_midnight(self):
+        previous_day = datetime.datetime(2029, 12, 31, 23, 30)
+        assignments = [
+            ('A1', self.agents[0], previous_day, previous_day + datetime.timedelta(hours=1)),
+            ('B1', self.agents[1], datetime.datetime(2030, 1, 1, 12, 0), datetime.datetime(2030, 1, 1, 12, 30)),
+            ('C1', self.agents[2], datetime.datetime(2030, 1, 1, 13, 0), datetime.datetime(2030, 1, 1, 13, 30)),
+        ]
+
+        # busy until 00:30
+        self.assertEqual(self.get_least_busy_available_agent(assignments, datetime.datetime(2030, 1, 1, 0, 0),
+            datetime.datetime(2030, 1, 1, 0, 30)), self.agents[1])
+
+        # previous day's appointment does not count towards today's workload
+        self.assertEqual(self.get_least_busy_available_agent(assignments, datetime.datetime(2030, 1, 1, 9, 0),
+            datetime.datetime(2030, 1, 1, 9, 30)), self.agents[0])
+
+    def test_appointment_excluded_from_own_check(self):
+        scheduled_dt = datetime.datetime(2030, 1, 1, 10, 0)
+        end_dt = datetime.datetime(2030, 1, 1, 10, 30)
+        assignments = [
+            ('_Test Appointment', self.agents[0], scheduled_dt, end_dt),
+            ('B1', self.agents[1], datetime.datetime(2030, 1, 1, 12, 0), datetime.datetime(2030, 1, 1, 12, 30)),
+            ('C1', self.agents[2], datetime.datetime(2030, 1, 1, 13, 0), datetime.datetime(2030, 1, 1, 13, 30)),
+        ]
+
+        self.assertEqual(self.get_least_busy_available_agent(assignments, scheduled_dt, end_dt), self.agents[1])
+        self.assertEqual(self.get_least_busy_available_agent(assignments, scheduled_dt, end_dt,
+            appointment='_Test Appointment'), self.agents[0])
@@ -6,7 +6,10 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import getdate, now_datetime, nowdate
+from frappe.utils import getdate, now_datetime, nowdate, cint, now
+from frappe.model.naming import getseries
+import hashlib
+import re
 
 
 class Contract(Document):
@@ -17,11 +20,15 @@ class Contract(Document):
 			name += " - {} Agreement".format(self.contract_template)
 
 		# If identical, append contract name with the next number in the iteration
-		if frappe.db.exists("Contract", name):
-			count = len(frappe.get_all("Contract", filters={"name": ["like", "%{}%".format(name)]}))
-			name = "{} - {}".format(name, count)
+		while True:
+			count = cint(getseries(get_contract_series_key(name), 1)) - 1
+			contract_name = "{} - {}".format(name, count) if count else name
 
-		self.name = _(name)
+			# counter may be behind contracts named before it was seeded
+			if not frappe.db.exists("Contract", _(contract_name)):
+				break
+
+		self.name = _(contract_name)
 
 	def validate(self):
 		self.validate_dates()
@@ -68,6 +75,33 @@ class Contract(Document):
 		return len([term for term in self.fulfilment_terms if term.fulfilled])
 
 
+def get_contract_series_key(name):
+	key = "Contract:{0}".format(name)
+	if len(key) > 100:
+		key = "Contract:{0}".format(hashlib.md5(name.encode()).hexdigest())
+
+	return key
+
+
+def seed_contract_series():
+	"""Sets the name counter of each Contract name prefix to the number of Contracts already named with it"""
+	counts = {}
+	for name in frappe.get_all("Contract", pluck="name"):
+		counts[name] = max(counts.get(name, 0), 1)
+
+		suffix_match = re.match(r"^(.*) - (\d+)$", name)
+		if suffix_match:
+			prefix, count = suffix_match.group(1), cint(suffix_match.group(2))
+			counts[prefix] = max(counts.get(prefix, 0), count + 1)
+
+	for prefix, current in counts.items():
+		frappe.db.sql("""
+			insert into `tabSeries` (name, current)
+			values (%(name)s, %(current)s)
+			on duplicate key update current = greatest(current, %(current)s)
+		""", {"name": get_contract_series_key(prefix), "current": current})
+
+
 def get_status(start_date, end_date):
 	"""
 	Get a Contract's status based on the start, current and end dates
@@ -93,16 +127,41 @@ def get_status(start_date, end_date):
 def update_status_for_contracts():
 	"""
 	Run the daily hook to update the statuses for all signed
-	and submitted Contracts
-	"""
+	and submitted Contracts and lapse unfulfilled Contracts past their fulfilment deadline
 
-	contracts = frappe.get_all("Contract",
-								filters={"is_signed": True,
-										"docstatus": 1},
-								fields=["name", "start_date", "end_date"])
-
-	for contract in contracts:
-		status = get_status(contract.get("start_date"),
-							contract.get("end_date"))
+	Returns:
+		dict: Number of Contracts changed to each status
+	"""
 
-		frappe.db.set_value("Contract", contract.get("name"), "status", status)
+	values = {"today": getdate(nowdate()), "now": now()}
+	active_condition = "(end_date is null or (start_date <= %(today)s and end_date >= %(today)s))"
+
+	status_updates = [
+		("Active", "status", """is_signed = 1 and docstatus = 1 and status != 'Active'
+			and {0}""".format(active_condition)),
+		("Inactive", "status", """is_signed = 1 and docstatus = 1 and status != 'Inactive'
+			and not {0}""".format(active_condition)),
+		("Lapsed", "fulfilment_status", """docstatus < 2 and requires_fulfilment = 1
+			and fulfilment_deadline < %(today)s and fulfilment_status not in ('Fulfilled', 'Lapsed')"""),
+	]
+
+	changed_counts = {}
+	for status, fieldname, condition in status_updates:
+		values["status"] = status
+
+		changed_counts[status] = frappe.db.sql("""
+			select count(*)
+			from `tabContract`
+			where {0}
+		""".format(condition), values)[0][0]
+
+		if changed_counts[status]:
+			frappe.db.sql("""
+				update `tabContract`
+				set `{0}` = %(status)s, modified = %(now)s
+				where {1}
+			""".format(fieldname, condition), values)
+
+	frappe.logger("contract").info({"update_status_for_contracts": changed_counts})
+
+	return changed_counts
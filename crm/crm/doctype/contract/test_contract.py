@@ -6,11 +6,14 @@ import unittest
 
 import frappe
 from frappe.utils import add_days, nowdate
+from crm.crm.doctype.contract.contract import update_status_for_contracts, get_contract_series_key,\
+	seed_contract_series
 
 class TestContract(unittest.TestCase):
 
 	def setUp(self):
 		frappe.db.sql("delete from `tabContract`")
+		frappe.db.sql("delete from `tabSeries` where name like 'Contract:%%'")
 		self.contract_doc = get_contract()
 
 	def test_validate_start_date_before_end_date(self):
@@ -110,6 +113,78 @@ class TestContract(unittest.TestCase):
 
 		self.assertEqual(self.contract_doc.fulfilment_status, "Lapsed")
 
+	def test_daily_contract_status_update(self):
+		self.contract_doc.is_signed = True
+		self.contract_doc.start_date = add_days(nowdate(), -2)
+		self.contract_doc.end_date = add_days(nowdate(), 1)
+		self.contract_doc.requires_fulfilment = 1
+		self.contract_doc.fulfilment_deadline = add_days(nowdate(), 1)
+		self.contract_doc.insert()
+		self.contract_doc.submit()
+
+		self.assertEqual(self.contract_doc.status, "Active")
+		self.assertEqual(self.contract_doc.fulfilment_status, "Unfulfilled")
+
+		# contract ended and missed its fulfilment deadline since it was last saved
+		frappe.db.set_value("Contract", self.contract_doc.name, {
+			"end_date": add_days(nowdate(), -1),
+			"fulfilment_deadline": add_days(nowdate(), -1),
+		}, update_modified=False)
+
+		changed_counts = update_status_for_contracts()
+		self.contract_doc.reload()
+
+		self.assertEqual(self.contract_doc.status, "Inactive")
+		self.assertEqual(self.contract_doc.fulfilment_status, "Lapsed")
+		self.assertEqual(changed_counts, {"Active": 0, "Inactive": 1, "Lapsed": 1})
+
+		# contract extended
+		frappe.db.set_value("Contract", self.contract_doc.name, "end_date", add_days(nowdate(), 1),
+			update_modified=False)
+
+		changed_counts = update_status_for_contracts()
+		self.contract_doc.reload()
+
+		self.assertEqual(self.contract_doc.status, "Active")
+		self.assertEqual(self.contract_doc.fulfilment_status, "Lapsed")
+		self.assertEqual(changed_counts, {"Active": 1, "Inactive": 0, "Lapsed": 0})
+
+		# unchanged statuses are not updated again
+		self.assertEqual(update_status_for_contracts(), {"Active": 0, "Inactive": 0, "Lapsed": 0})
+
+	def test_contract_name_counter(self):
+		names = [get_contract().insert().name for i in range(3)]
+		self.assertEqual(names, ["_Test Customer", "_Test Customer - 1", "_Test Customer - 2"])
+
+	def test_contract_series_key_for_long_names(self):
+		self.assertEqual(get_contract_series_key("_Test Customer"), "Contract:_Test Customer")
+
+		long_name = "_Test Customer " * 10
+		series_key = get_contract_series_key(long_name)
+		self.assertTrue(series_key.startswith("Contract:"))
+		self.assertLessEqual(len(series_key), 100)
+		self.assertEqual(series_key, get_contract_series_key(long_name))
+		self.assertNotEqual(series_key, get_contract_series_key(long_name + "2"))
+
+	def test_seed_contract_series(self):
+		get_contract().insert()
+		get_contract().insert()
+
+		# contracts named before the counter existed
+		frappe.db.sql("delete from `tabSeries` where name like 'Contract:%%'")
+		seed_contract_series()
+
+		self.assertEqual(frappe.db.get_value("Series", get_contract_series_key("_Test Customer"), "current"), 2)
+		self.assertEqual(get_contract().insert().name, "_Test Customer - 2")
+
+	def test_contract_name_skips_unseeded_names(self):
+		get_contract().insert()
+		get_contract().insert()
+
+		frappe.db.sql("delete from `tabSeries` where name like 'Contract:%%'")
+
+		self.assertEqual(get_contract().insert().name, "_Test Customer - 2")
+
 def get_contract():
 	doc = frappe.new_doc("Contract")
 	doc.party_type = "Customer"
@@ -4,9 +4,10 @@
 
 import frappe
 from frappe import _
-from frappe.utils import getdate, add_days, today, nowdate, cstr
+from frappe.utils import getdate, add_days, today, nowdate, cstr, now
 from frappe.model.document import Document
 from frappe.core.doctype.communication.email import make
+import json
 
 class EmailCampaign(Document):
 	def validate(self):
@@ -58,36 +59,113 @@ class EmailCampaign(Document):
 			self.status = "Completed"
 
 #called through hooks to send campaign mails to leads
-def send_email_to_leads_or_contacts():
-	email_campaigns = frappe.get_all("Email Campaign", filters = { 'status': ('not in', ['Unsubscribed', 'Completed', 'Scheduled']) })
-	for camp in email_campaigns:
-		email_campaign = frappe.get_doc("Email Campaign", camp.name)
-		campaign = frappe.get_cached_doc("Campaign", email_campaign.campaign_name)
-		for entry in campaign.get("campaign_schedules"):
-			scheduled_date = add_days(email_campaign.get('start_date'), entry.get('send_after_days'))
-			if scheduled_date == getdate(today()):
-				send_mail(entry, email_campaign)
-
-def send_mail(entry, email_campaign):
-	recipient = frappe.db.get_value(email_campaign.email_campaign_for, email_campaign.get("recipient"), 'email_id')
-
-	email_template = frappe.get_doc("Email Template", entry.get("email_template"))
-	sender = frappe.db.get_value("User", email_campaign.get("sender"), 'email')
-	context = {"doc": frappe.get_doc(email_campaign.email_campaign_for, email_campaign.recipient)}
-	# send mail and link communication to document
-	comm = make(
-		doctype = "Email Campaign",
-		name = email_campaign.name,
-		subject = frappe.render_template(email_template.get("subject"), context),
-		content = frappe.render_template(email_template.get("response"), context),
-		sender = sender,
-		recipients = recipient,
-		communication_medium = "Email",
-		sent_or_received = "Sent",
-		send_email = True,
-		email_template = email_template.name
-	)
-	return comm
+def send_email_to_leads_or_contacts(batch_size=500):
+	"""
+	Enqueues due campaign mails in batches of the same Email Template
+	Due mails are found by date since the stored status may not yet be refreshed for today
+	"""
+	due_mails = frappe.db.sql("""
+		select ec.name as email_campaign, ec.email_campaign_for, ec.recipient, ec.sender,
+			ces.email_template
+		from `tabEmail Campaign` ec
+		inner join `tabCampaign Email Schedule` ces on ces.parent = ec.campaign_name and ces.parenttype = 'Campaign'
+		where ec.status != 'Unsubscribed'
+			and date_add(ec.start_date, interval ces.send_after_days day) = %s
+		order by ces.email_template, ec.name
+	""", getdate(today()), as_dict=1)
+
+	mails_by_template = {}
+	for d in due_mails:
+		mails_by_template.setdefault(d.email_template, []).append(d)
+
+	for email_template, mails in mails_by_template.items():
+		for i in range(0, len(mails), batch_size):
+			frappe.enqueue("crm.crm.doctype.email_campaign.email_campaign.send_email_campaign_batch", queue="long",
+				email_template=email_template, mails=mails[i:i + batch_size])
+
+
+def send_email_campaign_batch(email_template, mails):
+	"""Sends mails of an Email Template with recipient documents and senders fetched in bulk"""
+	email_template = frappe.get_cached_doc("Email Template", email_template)
+
+	# compiled once per batch instead of once per mail
+	subject_template = get_safe_template(email_template.get("subject"))
+	response_template = get_safe_template(email_template.get("response"))
+
+	recipient_docs = get_recipient_docs(mails)
+
+	senders = list(set(d['sender'] for d in mails if d.get('sender')))
+	sender_emails = dict(frappe.get_all("User", filters={'name': ['in', senders]}, fields=['name', 'email'],
+		as_list=1)) if senders else {}
+
+	for d in mails:
+		recipient_doc = recipient_docs.get((d['email_campaign_for'], d['recipient']))
+		if not recipient_doc or not recipient_doc.get('email_id'):
+			continue
+
+		# one failing recipient should not stop the rest of the batch
+		frappe.db.savepoint("email_campaign_mail")
+		try:
+			context = {"doc": recipient_doc}
+
+			# send mail and link communication to document
+			make(
+				doctype="Email Campaign",
+				name=d['email_campaign'],
+				subject=subject_template.render(context),
+				content=response_template.render(context),
+				sender=sender_emails.get(d.get('sender')),
+				recipients=recipient_doc.get('email_id'),
+				communication_medium="Email",
+				sent_or_received="Sent",
+				send_email=True,
+				email_template=email_template.name
+			)
+		except Exception:
+			frappe.db.rollback(save_point="email_campaign_mail")
+			frappe.log_error(title=_("Error sending Email Campaign {0}").format(d['email_campaign']),
+				message=frappe.get_traceback())
+
+	frappe.db.commit()
+
+
+def get_safe_template(template):
+	# same guard as frappe.render_template, checked once for the compiled template
+	template = cstr(template)
+	if ".__" in template:
+		frappe.throw(_("Illegal template"))
+
+	return frappe.get_jenv().from_string(template)
+
+
+def get_recipient_docs(mails):
+	"""Returns recipient documents with child tables loaded with one query per table, bypassing the document cache"""
+	names_by_doctype = {}
+	for d in mails:
+		names_by_doctype.setdefault(d['email_campaign_for'], set()).add(d['recipient'])
+
+	recipient_docs = {}
+	for doctype, names in names_by_doctype.items():
+		names = list(names)
+		rows = {d.name: d for d in frappe.get_all(doctype, filters={'name': ['in', names]}, fields=['*'])}
+
+		for df in frappe.get_meta(doctype).get_table_fields():
+			for row in rows.values():
+				row[df.fieldname] = []
+
+			for child in frappe.db.sql("""
+				select *
+				from `tab{0}`
+				where parenttype = %(doctype)s and parentfield = %(parentfield)s and parent in %(names)s
+				order by idx
+			""".format(df.options), {'doctype': doctype, 'parentfield': df.fieldname, 'names': names}, as_dict=1):
+				if child.parent in rows:
+					rows[child.parent][df.fieldname].append(child)
+
+		for name, row in rows.items():
+			recipient_docs[(doctype, name)] = frappe.get_doc(dict(row, doctype=doctype))
+
+	return recipient_docs
 
 #called from hooks on doc_event Email Unsubscribe
 def unsubscribe_recipient(unsubscribe, method):
@@ -96,7 +174,41 @@ def unsubscribe_recipient(unsubscribe, method):
 
 #called through hooks to update email campaign status daily
 def set_email_campaign_status():
-	email_campaigns = frappe.get_all("Email Campaign", filters = { 'status': ('!=', 'Unsubscribed')})
-	for entry in email_campaigns:
-		email_campaign = frappe.get_doc("Email Campaign", entry.name)
-		email_campaign.update_status()
+	values = {'today': getdate(today()), 'now': now()}
+	status_conditions = [
+		("Scheduled", "start_date > %(today)s"),
+		("In Progress", "start_date <= %(today)s and end_date >= %(today)s"),
+		("Completed", "end_date < %(today)s"),
+	]
+
+	changed_counts = {}
+	for status, condition in status_conditions:
+		values['status'] = status
+		condition = "status not in ('Unsubscribed', %(status)s) and {0}".format(condition)
+
+		changed_counts[status] = frappe.db.sql("""
+			select count(*)
+			from `tabEmail Campaign`
+			where {0}
+		""".format(condition), values)[0][0]
+
+		if changed_counts[status]:
+			frappe.db.sql("""
+				update `tabEmail Campaign`
+				set status = %(status)s, modified = %(now)s
+				where {0}
+			""".format(condition), values)
+
+	add_email_campaign_status_audit(changed_counts)
+
+
+def add_email_campaign_status_audit(changed_counts, max_entries=30):
+	# keep the number of Email Campaigns changed to each status for the last few runs
+	audit = {'date': cstr(getdate(today())), 'changed_counts': changed_counts}
+
+	frappe.cache().lpush("email_campaign_status_audit", json.dumps(audit))
+	frappe.cache().ltrim("email_campaign_status_audit", 0, max_entries - 1)
+
+
+def get_email_campaign_status_audit():
+	return [json.loads(frappe.safe_decode(d)) for d in frappe.cache().lrange("email_campaign_status_audit", 0, -1)]
@@ -35,6 +35,7 @@ class Lead(StatusUpdater):
 		self.validate_tax_id()
 		self.check_email_id_is_unique()
 		self.set_gravatar()
+		self.set_opportunity_counts()
 		self.set_status()
 
 	def validate_lead_name(self):
@@ -92,29 +93,95 @@ class Lead(StatusUpdater):
 			if self.is_new() or not self.image:
 				self.image = has_gravatar(self.email_id)
 
+	def set_opportunity_counts(self):
+		# counts are updated without changing modified, so values from a stale form or an import are not trusted
+		if self.is_new():
+			self.update_opportunity_counts(opportunity_counts={})
+		else:
+			self.update_opportunity_counts()
+
 	def is_opportunity(self):
 		return self.has_opportunity()
 
 	def has_opportunity(self):
-		return frappe.db.get_value("Opportunity", {
-			"opportunity_from": "Lead", "party_name": self.name, "status": ["!=", "Lost"]
-		})
+		return cint(self.get('active_opportunity_count')) > 0
 
 	def is_lost_opportunity(self):
 		return self.has_lost_opportunity()
 
 	def has_lost_opportunity(self):
-		return frappe.db.get_value("Opportunity", {
-			"opportunity_from": "Lead", "party_name": self.name, "status": ["=", "Lost"]
-		})
+		return cint(self.get('lost_opportunity_count')) > 0
 
 	def is_converted(self):
 		return self.has_converted_opportunity()
 
 	def has_converted_opportunity(self):
-		return frappe.db.get_value("Opportunity", {
-			"opportunity_from": "Lead", "party_name": self.name, "status": ["=", "Converted"]
-		})
+		return cint(self.get('converted_opportunity_count')) > 0
+
+	def update_opportunity_counts(self, update=False, opportunity_counts=None):
+		if opportunity_counts is None:
+			opportunity_counts = get_lead_opportunity_counts(self.name).get(self.name) or {}
+
+		values = frappe._dict()
+		for fieldname in opportunity_count_fields:
+			values[fieldname] = cint(opportunity_counts.get(fieldname))
+
+		self.update(values)
+
+		if update:
+			self.db_set(values, update_modified=False)
+
+
+def on_doctype_update():
+	from crm.crm.lead_search import setup_lead_search_table
+	from crm.crm.lead_efficiency import setup_lead_efficiency_table
+	setup_lead_search_table()
+	setup_lead_efficiency_table()
+
+
+opportunity_count_fields = ['active_opportunity_count', 'lost_opportunity_count', 'converted_opportunity_count']
+
+
+def get_lead_opportunity_counts(leads):
+	if not leads:
+		return {}
+
+	if isinstance(leads, str):
+		leads = [leads]
+
+	opportunity_counts = frappe.db.sql("""
+		select party_name,
+			sum(status != 'Lost') as active_opportunity_count,
+			sum(status = 'Lost') as lost_opportunity_count,
+			sum(status = 'Converted') as converted_opportunity_count
+		from `tabOpportunity`
+		where opportunity_from = 'Lead' and party_name in %s
+		group by party_name
+	""", [leads], as_dict=1)
+
+	return {d.party_name: d for d in opportunity_counts}
+
+
+def update_lead_opportunity_counts(chunk_size=1000):
+	"""Backfills Lead opportunity counts from Opportunities"""
+	frappe.db.sql("""
+		update `tabLead`
+		set active_opportunity_count = 0, lost_opportunity_count = 0, converted_opportunity_count = 0
+	""")
+
+	leads = frappe.db.sql_list("""
+		select distinct party_name
+		from `tabOpportunity`
+		where opportunity_from = 'Lead' and ifnull(party_name, '') != ''
+	""")
+
+	for i in range(0, len(leads), chunk_size):
+		opportunity_counts = get_lead_opportunity_counts(leads[i:i + chunk_size])
+		for lead, counts in opportunity_counts.items():
+			frappe.db.set_value("Lead", lead, {f: cint(counts.get(f)) for f in opportunity_count_fields},
+				update_modified=False)
+
+		frappe.db.commit()
 
 
 @frappe.whitelist()
@@ -210,13 +277,11 @@ def make_lead_from_communication(communication, ignore_communication_links=False
 
 
 def get_lead_with_phone_number(number):
-	if not number: return
+	from crm.crm.phone_number_index import find_by_phone_number
 
-	leads = frappe.get_all('Lead', or_filters={
-		'phone': ['like', '%{}'.format(number)],
-		'mobile_no': ['like', '%{}'.format(number)]
-	}, limit=1)
+	if not number: return
 
-	lead = leads[0].name if leads else None
+	leads = find_by_phone_number(number, "Lead", limit=1)
+	lead = leads[0] if leads else None
 
 	return lead
@@ -1,9 +1,72 @@
 # Copyright (c) 2023, ParaLogic and Contributors
 # See license.txt
 
-# import frappe
+import frappe
+from frappe.utils import nowdate
 from frappe.tests.utils import FrappeTestCase
+from crm.crm.phone_number_index import find_by_phone_number, find_by_phone_numbers, insert_phone_numbers,\
+	get_reversed_number
 
 
 class TestLead(FrappeTestCase):
-	pass
+	def test_stale_lead_keeps_opportunity_counts(self):
+		lead = frappe.get_doc({"doctype": "Lead", "lead_name": "_Test Stale Lead"}).insert()
+
+		# form opened before the Opportunity was created
+		stale_lead = frappe.get_doc("Lead", lead.name)
+
+		frappe.get_doc({
+			"doctype": "Opportunity",
+			"opportunity_from": "Lead",
+			"party_name": lead.name,
+			"transaction_date": nowdate(),
+		}).insert()
+
+		self.assertEqual(frappe.db.get_value("Lead", lead.name, "active_opportunity_count"), 1)
+
+		stale_lead.save()
+
+		self.assertEqual(stale_lead.active_opportunity_count, 1)
+		self.assertEqual(stale_lead.status, "Opportunity")
+		self.assertEqual(frappe.db.get_value("Lead", lead.name, "status"), "Opportunity")
+
+	def test_imported_opportunity_counts_are_ignored(self):
+		lead = frappe.get_doc({"doctype": "Lead", "lead_name": "_Test Imported Lead",
+			"converted_opportunity_count": 2}).insert()
+
+		self.assertEqual(lead.converted_opportunity_count, 0)
+		self.assertNotEqual(lead.status, "Converted")
+
+	def test_find_lead_by_phone_number(self):
+		lead = frappe.get_doc({"doctype": "Lead", "lead_name": "_Test Phone Lead",
+			"mobile_no": "0300-9871234"}).insert()
+
+		self.assertIn(lead.name, find_by_phone_number("3009871234", "Lead"))
+		self.assertIn(lead.name, find_by_phone_number("03009871234", "Lead"))
+		self.assertIn(lead.name, find_by_phone_number("0300-9871234", "Lead"))
+
+		# stored international form is found by the local number
+		insert_phone_numbers({("Call Log", "_Test Phone Call Log"): ["+923009871234"]})
+		self.assertIn("_Test Phone Call Log", find_by_phone_number("3009871234", "Call Log"))
+		self.assertIn("_Test Phone Call Log", find_by_phone_number("03009871234", "Call Log"))
+
+	def test_find_lead_by_phone_number_suffix(self):
+		lead = frappe.get_doc({"doctype": "Lead", "lead_name": "_Test Phone Suffix Lead",
+			"mobile_no": "0300-9872345"}).insert()
+
+		# a shorter number matches as a suffix, a longer one does not
+		self.assertIn(lead.name, find_by_phone_number("9872345", "Lead"))
+		self.assertNotIn(lead.name, find_by_phone_number("923009872345", "Lead"))
+
+		self.assertIn((get_reversed_number("03009872345"), lead.name),
+			find_by_phone_numbers(["9872345", "923009872345"], "Lead"))
+
+	def test_phone_number_index_updated_on_edit(self):
+		lead = frappe.get_doc({"doctype": "Lead", "lead_name": "_Test Phone Edit Lead",
+			"mobile_no": "0300-9873456"}).insert()
+
+		lead.mobile_no = "0321-9874567"
+		lead.save()
+
+		self.assertNotIn(lead.name, find_by_phone_number("3009873456", "Lead"))
+		self.assertIn(lead.name, find_by_phone_number("3219874567", "Lead"))
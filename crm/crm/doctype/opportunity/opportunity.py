@@ -6,14 +6,13 @@ from frappe import _
 from frappe.utils import today, getdate, cint, clean_whitespace, comma_or, cstr, validate_email_address
 from frappe.model.mapper import get_mapped_doc
 from frappe.email.inbox import link_communication_to_document
-from frappe.contacts.doctype.address.address import get_default_address
-from frappe.contacts.doctype.contact.contact import get_default_contact
 from frappe.core.doctype.sms_settings.sms_settings import enqueue_template_sms
 from frappe.core.doctype.notification_count.notification_count import get_all_notification_count
 from frappe.utils.status_updater import StatusUpdater
 from frappe.model.document import Document
 from crm.crm.doctype.sales_person.sales_person import get_sales_person_from_user
-from crm.crm.utils import get_contact_details, get_address_display
+from crm.crm.doctype.lead.lead import get_lead_opportunity_counts
+from crm.crm.party import get_party_details, needs_party_details_refresh
 from frappe.rate_limiter import rate_limit
 import json
 
@@ -21,6 +20,8 @@ import json
 subject_field = "title"
 sender_field = "contact_email"
 
+set_multiple_status_background_threshold = 100
+
 
 class Opportunity(StatusUpdater):
 	selling_or_buying = "selling"
@@ -30,6 +31,9 @@ class Opportunity(StatusUpdater):
 		'address_display', 'contact_display', 'contact_email', 'contact_mobile', 'contact_phone'
 	]
 
+	party_type_field = 'opportunity_from'
+	party_link_fields = ['opportunity_from', 'party_name', 'contact_person', 'customer_address']
+
 	def get_feed(self):
 		return _("From {0}").format(self.get("customer_name") or self.get('party_name'))
 
@@ -49,6 +53,9 @@ class Opportunity(StatusUpdater):
 		self.update_lead_status()
 		self.send_opportunity_greeting()
 
+	def on_update(self):
+		self.update_changed_lead_status()
+
 	def after_delete(self):
 		self.update_lead_status(status="Interested")
 
@@ -70,30 +77,33 @@ class Opportunity(StatusUpdater):
 	def set_status(self, update=False, status=None, update_modified=True):
 		previous_status = self.status
 
-		if status:
-			self.status = status
+		self.status = self.get_status(status)
+
+		self.add_status_comment(previous_status)
+
+		if update:
+			self.db_set('status', self.status, update_modified=update_modified)
+
+	def get_status(self, status=None):
+		status = status or self.status
 
-		has_active_quotation = self.has_active_quotation()
+		has_active_quotation = self.get_memoized_status_input('has_active_quotation', self.has_active_quotation)
 
 		if self.is_converted():
-			self.status = "Converted"
-		elif self.status == "Closed":
-			self.status = "Closed"
-		elif self.status == "Lost" or (not has_active_quotation and self.has_lost_quotation()):
-			self.status = "Lost"
+			return "Converted"
+		elif status == "Closed":
+			return "Closed"
+		elif status == "Lost" or (not has_active_quotation
+				and self.get_memoized_status_input('has_lost_quotation', self.has_lost_quotation)):
+			return "Lost"
 		elif self.get("next_follow_up") and getdate(self.next_follow_up) >= getdate():
-			self.status = "To Follow Up"
+			return "To Follow Up"
 		elif has_active_quotation:
-			self.status = "Quotation"
+			return "Quotation"
 		elif self.has_communication():
-			self.status = "Replied"
+			return "Replied"
 		else:
-			self.status = "Open"
-
-		self.add_status_comment(previous_status)
-
-		if update:
-			self.db_set('status', self.status, update_modified=update_modified)
+			return "Open"
 
 	def set_sales_person(self):
 		if not self.get('sales_person') and self.is_new():
@@ -104,6 +114,9 @@ class Opportunity(StatusUpdater):
 		self.set_sales_person_details()
 
 	def set_customer_details(self):
+		if not needs_party_details_refresh(self, self.party_link_fields):
+			return
+
 		customer_details = get_customer_details(self.as_dict())
 		for k, v in customer_details.items():
 			if self.meta.has_field(k) and (not self.get(k) or k in self.force_party_fields):
@@ -236,9 +249,35 @@ class Opportunity(StatusUpdater):
 	def update_lead_status(self, status=None):
 		if self.opportunity_from == "Lead" and self.party_name:
 			doc = frappe.get_doc("Lead", self.party_name)
+			doc.update_opportunity_counts(update=True)
 			doc.set_status(update=True, status=status)
 			doc.notify_update()
 
+	def update_changed_lead_status(self):
+		# recount the current and the previous Lead if the Lead or status changed on save
+		doc_before_save = self.get_doc_before_save()
+		if not doc_before_save:
+			return
+
+		if (
+			doc_before_save.status == self.status
+			and doc_before_save.opportunity_from == self.opportunity_from
+			and doc_before_save.party_name == self.party_name
+		):
+			return
+
+		leads = []
+		for d in (self, doc_before_save):
+			if d.opportunity_from == "Lead" and d.party_name and d.party_name not in leads:
+				leads.append(d.party_name)
+
+		opportunity_counts = get_lead_opportunity_counts(leads)
+		for lead in leads:
+			doc = frappe.get_doc("Lead", lead)
+			doc.update_opportunity_counts(update=True, opportunity_counts=opportunity_counts.get(lead) or {})
+			doc.set_status(update=True)
+			doc.notify_update()
+
 	def has_active_quotation(self):
 		return False
 
@@ -249,25 +288,91 @@ class Opportunity(StatusUpdater):
 		if self.is_new():
 			return False
 
-		appointment = frappe.db.get_value("Appointment", {
-			"opportunity": self.name,
-			"docstatus": (">", 0),
-		})
-
-		if appointment:
-			return True
-
-		return False
+		return self.get_status_dependencies().is_converted
 
 	def has_communication(self):
 		if self.is_new():
 			return False
 
-		return frappe.db.get_value("Communication", filters={
-			'reference_doctype': self.doctype,
-			'reference_name': self.name,
-			'communication_type': ['!=', 'Automated Message']
-		})
+		return self.get_status_dependencies().has_communication
+
+	def get_status_dependencies(self):
+		memo = get_opportunity_status_memo(self.name)
+		if 'is_converted' not in memo or 'has_communication' not in memo:
+			memo.update(get_opportunity_status_dependencies(self.name, self.doctype))
+
+		return memo
+
+	def get_memoized_status_input(self, key, getter):
+		if self.is_new():
+			return getter()
+
+		memo = get_opportunity_status_memo(self.name)
+		if key not in memo:
+			memo[key] = getter()
+
+		return memo[key]
+
+
+def get_opportunity_status_dependencies_for_names(names, doctype="Opportunity"):
+	if not names:
+		return {}
+
+	converted = set(frappe.db.sql_list("""
+		select distinct opportunity
+		from `tabAppointment`
+		where opportunity in %s and docstatus > 0
+	""", [names]))
+
+	has_communication = set(frappe.db.sql_list("""
+		select distinct reference_name
+		from `tabCommunication`
+		where reference_doctype = %s and reference_name in %s and communication_type != 'Automated Message'
+	""", [doctype, names]))
+
+	return {name: frappe._dict({
+		'is_converted': name in converted,
+		'has_communication': name in has_communication,
+	}) for name in names}
+
+
+def get_opportunity_status_dependencies(name, doctype="Opportunity"):
+	res = frappe.db.sql("""
+		select
+			exists(select a.name from `tabAppointment` a
+				where a.opportunity = %(name)s and a.docstatus > 0) as is_converted,
+			exists(select c.name from `tabCommunication` c
+				where c.reference_doctype = %(doctype)s and c.reference_name = %(name)s
+					and c.communication_type != 'Automated Message') as has_communication
+	""", {'name': name, 'doctype': doctype}, as_dict=1)
+
+	return frappe._dict({
+		'is_converted': bool(res and res[0].is_converted),
+		'has_communication': bool(res and res[0].has_communication),
+	})
+
+
+def get_opportunity_status_memo(name):
+	# request scoped memo of Opportunity status inputs, cleared when related documents change
+	if frappe.flags.opportunity_status_memo is None:
+		frappe.flags.opportunity_status_memo = {}
+
+	return frappe.flags.opportunity_status_memo.setdefault(name, frappe._dict())
+
+
+def clear_opportunity_status_memo(name=None):
+	if not frappe.flags.opportunity_status_memo:
+		return
+
+	if name:
+		frappe.flags.opportunity_status_memo.pop(name, None)
+	else:
+		frappe.flags.opportunity_status_memo = {}
+
+
+def clear_opportunity_status_memo_for_communication(doc, method=None):
+	if doc.get('reference_doctype') == "Opportunity" and doc.get('reference_name'):
+		clear_opportunity_status_memo(doc.reference_name)
 
 
 @frappe.whitelist()
@@ -286,34 +391,10 @@ def get_customer_details(args):
 	opportunity_controller = get_controller("Opportunity")
 	opportunity_controller.validate_opportunity_from(args.opportunity_from)
 
-	party = frappe.get_cached_doc(args.opportunity_from, args.party_name)
-
-	# Customer Name
-	if party.doctype == "Lead":
-		out.customer_name = party.company_name or party.lead_name
-	else:
-		out.customer_name = party.get("customer_name")
-
-	# Tax IDs
-	out.tax_id = party.get('tax_id')
-	out.tax_cnic = party.get('tax_cnic')
-	out.tax_strn = party.get('tax_strn')
-
-	lead = party if party.doctype == "Lead" else None
-
-	# Address
-	out.customer_address = args.customer_address
-	if not out.customer_address and party.doctype != "Lead":
-		out.customer_address = get_default_address(party.doctype, party.name)
-
-	out.address_display = get_address_display(out.customer_address, lead=lead)
-
-	# Contact
-	out.contact_person = args.contact_person
-	if not out.contact_person and party.doctype != "Lead":
-		out.contact_person = get_default_contact(party.doctype, party.name)
-
-	out.update(get_contact_details(out.contact_person, lead=lead))
+	party_details = get_party_details(args.opportunity_from, args.party_name,
+		contact_person=args.contact_person, customer_address=args.customer_address)
+	party = party_details.pop('party')
+	out.update(party_details)
 
 	out.territory = party.get("territory")
 	out.campaign = party.get("campaign")
@@ -321,7 +402,7 @@ def get_customer_details(args):
 	if party.get("sales_person"):
 		out.sales_person = party.get("sales_person")
 
-	if party.get("source") and party.meta.get_options("source") == "Lead Source":
+	if party.get("source") and frappe.get_meta(party.doctype).get_options("source") == "Lead Source":
 		out.source = party.get("source")
 
 	return out
@@ -353,11 +434,121 @@ def make_appointment(source_name, target_doc=None):
 
 @frappe.whitelist()
 def set_multiple_status(names, status):
-	names = json.loads(names)
-	for name in names:
-		opp = frappe.get_doc("Opportunity", name)
-		opp.status = status
-		opp.save()
+	if isinstance(names, str):
+		names = json.loads(names)
+
+	if status not in ("Open", "Closed"):
+		frappe.throw(_("Status must be {0}").format(comma_or(["Open", "Closed"])))
+
+	names = list(dict.fromkeys(names or []))
+
+	if len(names) > set_multiple_status_background_threshold:
+		frappe.enqueue("crm.crm.doctype.opportunity.opportunity.set_multiple_status_in_bulk", queue="long",
+			timeout=3000, names=names, status=status, publish_progress=True)
+		frappe.msgprint(_("Status of {0} Opportunities will be updated in the background").format(len(names)),
+			alert=True)
+		return frappe._dict({'queued': True, 'errors': []})
+
+	out = set_multiple_status_in_bulk(names, status)
+	show_set_multiple_status_errors(out.errors)
+	return out
+
+
+def set_multiple_status_in_bulk(names, status, publish_progress=False):
+	"""Sets status of multiple Opportunities without saving them, returns per row errors"""
+	out = frappe._dict({'updated': [], 'errors': []})
+	if not names:
+		return out
+
+	rows = frappe.db.sql("select * from `tabOpportunity` where name in %s", [names], as_dict=1)
+	rows_map = {d.name: d for d in rows}
+
+	# preload status dependencies into the request memo so that get_status does not query per row
+	for name, dependencies in get_opportunity_status_dependencies_for_names(list(rows_map.keys())).items():
+		get_opportunity_status_memo(name).update(dependencies)
+
+	new_statuses = {}
+	for i, name in enumerate(names):
+		if publish_progress and i % 100 == 0:
+			frappe.publish_progress(i * 100 / len(names), title=_("Setting Opportunity Status"),
+				description=_("Checking {0} of {1}").format(i, len(names)))
+
+		row = rows_map.get(name)
+		if not row:
+			out.errors.append({'name': name, 'error': _("Opportunity {0} does not exist").format(name)})
+			continue
+
+		doc = frappe.get_doc(dict(row, doctype="Opportunity"))
+		if not frappe.has_permission("Opportunity", "write", doc=doc):
+			out.errors.append({'name': name, 'error': _("Not permitted to update Opportunity {0}").format(name)})
+			continue
+
+		new_status = doc.get_status(status)
+		if status == "Closed" and new_status != "Closed":
+			out.errors.append({'name': name,
+				'error': _("Cannot close Opportunity {0} because it is {1}").format(name, new_status)})
+			continue
+
+		if new_status != row.status:
+			new_statuses[name] = new_status
+
+	if new_statuses:
+		when_conditions = " ".join(["when %s then %s"] * len(new_statuses))
+		when_values = [v for name_status in new_statuses.items() for v in name_status]
+
+		frappe.db.sql("""
+			update `tabOpportunity`
+			set status = (case name {0} end), modified = %s, modified_by = %s
+			where name in %s
+		""".format(when_conditions), when_values + [frappe.utils.now(), frappe.session.user, list(new_statuses)])
+
+		add_status_comments("Opportunity", new_statuses)
+		update_leads_status_for_opportunities(list(new_statuses))
+
+		for name in new_statuses:
+			clear_opportunity_status_memo(name)
+
+		frappe.publish_realtime("list_update", {"doctype": "Opportunity"}, after_commit=True)
+
+	if publish_progress:
+		frappe.publish_progress(100, title=_("Setting Opportunity Status"),
+			description=_("Updated {0}, Errors {1}").format(len(new_statuses), len(out.errors)))
+
+		if out.errors:
+			frappe.log_error(title=_("Errors setting status of multiple Opportunities"),
+				message="\n".join("{0}: {1}".format(d['name'], d['error']) for d in out.errors))
+
+		# the user who queued the update is notified once it is done
+		frappe.msgprint(_("Status of {0} Opportunities updated").format(len(new_statuses)),
+			indicator="green", realtime=True)
+		show_set_multiple_status_errors(out.errors, realtime=True)
+
+	out.updated = list(new_statuses)
+	return out
+
+
+def show_set_multiple_status_errors(errors, realtime=False):
+	if not errors:
+		return
+
+	frappe.msgprint([[_("Opportunity"), _("Error")]] + [[d['name'], d['error']] for d in errors],
+		title=_("Status of {0} Opportunities could not be updated").format(len(errors)), as_table=True,
+		indicator="orange", realtime=realtime)
+
+
+def add_status_comments(doctype, statuses):
+	"""Inserts status comments in bulk for a dict of {name: status}"""
+	if not statuses:
+		return
+
+	now = frappe.utils.now()
+	user = frappe.session.user
+
+	frappe.db.bulk_insert("Comment", fields=[
+		'name', 'comment_type', 'reference_doctype', 'reference_name', 'content', 'comment_email', 'creation',
+		'modified', 'owner', 'modified_by'
+	], values=[(frappe.generate_hash(length=10), 'Label', doctype, name, _(status), user, now, now, user, user)
+		for name, status in statuses.items()])
 
 
 def auto_mark_opportunity_as_lost():
@@ -368,31 +559,125 @@ def auto_mark_opportunity_as_lost():
 	if cint(mark_opportunity_lost_after_days) < 1:
 		return
 
+	chunk_size = cint(frappe.db.get_single_value("CRM Settings", "auto_mark_opportunity_lost_chunk_size")) or 500
+
 	lost_reasons_list = []
 	lost_reason = frappe.db.get_single_value("CRM Settings", "opportunity_auto_lost_reason")
 	if lost_reason:
 		lost_reasons_list.append({'lost_reason': lost_reason})
 
-	opportunities = frappe.db.sql("""
-		SELECT name FROM tabOpportunity
-		WHERE status IN ('Open', 'Replied', 'Quotation')
-		AND modified < DATE_SUB(CURDATE(), INTERVAL %s DAY)
-	""", (mark_opportunity_lost_after_days), as_dict=True)
+	opportunities = frappe.db.sql_list("""
+		SELECT o.name FROM tabOpportunity o
+		WHERE o.status IN ('Open', 'Replied', 'Quotation')
+		AND o.modified < DATE_SUB(CURDATE(), INTERVAL %s DAY)
+	""", (mark_opportunity_lost_after_days))
 
-	for opportunity in opportunities:
-		doc = frappe.get_doc("Opportunity", opportunity.get("name"))
+	for i in range(0, len(opportunities), chunk_size):
+		chunk = opportunities[i:i + chunk_size]
 		try:
-			doc.set_is_lost(True, lost_reasons_list=lost_reasons_list)
+			set_multiple_opportunities_as_lost(chunk, lost_reasons_list=lost_reasons_list, notify=False)
 			frappe.db.commit()
 		except Exception:
 			frappe.db.rollback()
 			traceback = frappe.get_traceback()
-			doc.log_error(
-				title=_("Error: auto_mark_opportunity_as_lost for Opportunity: {}").format(doc.name),
+			frappe.log_error(
+				title=_("Error: auto_mark_opportunity_as_lost for Opportunities: {0} to {1}").format(chunk[0], chunk[-1]),
 				message=traceback,
 			)
 			frappe.db.commit()
 
+	if opportunities:
+		frappe.publish_realtime("list_update", {"doctype": "Opportunity"}, after_commit=True)
+
+
+def set_multiple_opportunities_as_lost(names, lost_reasons_list=None, detailed_reason=None, notify=True):
+	"""
+	Marks Opportunities as Lost using set based updates of status and lost reasons
+	Returns names of converted Opportunities which are not marked as Lost
+	"""
+	if not names:
+		return []
+
+	from frappe.model.base_document import get_controller
+
+	# prime the status memo so that is_converted does not query for each Opportunity
+	status_dependencies = get_opportunity_status_dependencies_for_names(names)
+	for name, dependencies in status_dependencies.items():
+		get_opportunity_status_memo(name).update(dependencies)
+
+	# documents are only loaded if an app overrides the hooks called for each Opportunity marked as Lost
+	opportunity_controller = get_controller("Opportunity")
+	if has_overridden_lost_hooks(opportunity_controller):
+		docs = [frappe.get_doc("Opportunity", name) for name in names]
+		converted = [doc.name for doc in docs if doc.is_converted()]
+
+		docs = [doc for doc in docs if doc.name not in converted]
+		for doc in docs:
+			doc.set_next_document_is_lost(True, lost_reasons_list, detailed_reason)
+
+		names = [doc.name for doc in docs]
+	else:
+		converted = [name for name in names if status_dependencies[name].is_converted]
+		names = [name for name in names if name not in converted]
+
+	if not names:
+		return converted
+
+	now = frappe.utils.now()
+	user = frappe.session.user
+
+	frappe.db.sql("""
+		update `tabOpportunity`
+		set status = 'Lost', order_lost_reason = %(detailed_reason)s, modified = %(now)s, modified_by = %(user)s
+		where name in %(names)s
+	""", {'names': names, 'detailed_reason': detailed_reason, 'now': now, 'user': user})
+
+	frappe.db.sql("""
+		delete from `tabLost Reason Detail`
+		where parenttype = 'Opportunity' and parentfield = 'lost_reasons' and parent in %s
+	""", [names])
+
+	if lost_reasons_list:
+		lost_reason_values = []
+		for name in names:
+			for idx, reason in enumerate(lost_reasons_list, start=1):
+				lost_reason_values.append((frappe.generate_hash(length=10), name, 'Opportunity', 'lost_reasons', idx,
+					reason.get('lost_reason'), now, now, user, user))
+
+		frappe.db.bulk_insert("Lost Reason Detail", fields=[
+			'name', 'parent', 'parenttype', 'parentfield', 'idx', 'lost_reason', 'creation', 'modified', 'owner',
+			'modified_by'
+		], values=lost_reason_values)
+
+	add_status_comments("Opportunity", {name: "Lost" for name in names})
+
+	update_leads_status_for_opportunities(names)
+
+	if notify:
+		frappe.publish_realtime("list_update", {"doctype": "Opportunity"}, after_commit=True)
+
+	return converted
+
+
+def has_overridden_lost_hooks(opportunity_controller):
+	return opportunity_controller.set_next_document_is_lost is not Opportunity.set_next_document_is_lost\
+		or opportunity_controller.is_converted is not Opportunity.is_converted
+
+
+def update_leads_status_for_opportunities(names):
+	leads = frappe.db.sql_list("""
+		select distinct party_name
+		from `tabOpportunity`
+		where name in %s and opportunity_from = 'Lead' and ifnull(party_name, '') != ''
+	""", [names])
+
+	opportunity_counts = get_lead_opportunity_counts(leads)
+
+	for lead in leads:
+		doc = frappe.get_doc("Lead", lead)
+		doc.update_opportunity_counts(update=True, opportunity_counts=opportunity_counts.get(lead) or {})
+		doc.set_status(update=True)
+
 
 @frappe.whitelist()
 def schedule_follow_up(name, schedule_date, to_discuss=None):
@@ -28,6 +28,10 @@ frappe.listview_settings['Opportunity'] = {
 			listview.call_for_selected_items(method, {"status": "Closed"});
 		});
 
+		listview.page.add_action_item(__("Update Party Details"), function() {
+			listview.call_for_selected_items("crm.crm.party.update_party_details", {"doctype": "Opportunity"});
+		});
+
 		if (listview.page.fields_dict.opportunity_from) {
 			listview.page.fields_dict.opportunity_from.get_query = function() {
 				return {
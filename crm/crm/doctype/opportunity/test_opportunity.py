@@ -1,9 +1,64 @@
 # Copyright (c) 2023, ParaLogic and Contributors
 # See license.txt
 
-# import frappe
+import frappe
+from frappe.utils import nowdate
 from frappe.tests.utils import FrappeTestCase
+from unittest.mock import patch
+from crm.crm.party import resolve_many, clear_party_details_memo
+from crm.crm.doctype.opportunity.opportunity import Opportunity, has_overridden_lost_hooks, set_multiple_status
 
 
 class TestOpportunity(FrappeTestCase):
-	pass
+	def setUp(self):
+		clear_party_details_memo()
+
+	def test_resolve_many_party_details(self):
+		leads = [frappe.get_doc({"doctype": "Lead", "lead_name": "_Test Party Lead {0}".format(i)}).insert()
+			for i in range(2)]
+
+		party_details = resolve_many([("Lead", lead.name, None, None) for lead in leads])
+
+		self.assertEqual([d.customer_name for d in party_details], [lead.lead_name for lead in leads])
+		self.assertEqual([d.contact_display for d in party_details], [lead.lead_name for lead in leads])
+
+	def test_resolve_many_unknown_party(self):
+		self.assertRaises(frappe.DoesNotExistError, resolve_many, [("Lead", "_Test Unknown Lead", None, None)])
+
+	def test_overridden_lost_hooks(self):
+		class CustomOpportunity(Opportunity):
+			def set_next_document_is_lost(self, is_lost, lost_reasons_list=None, detailed_reason=None):
+				pass
+
+		self.assertFalse(has_overridden_lost_hooks(Opportunity))
+		self.assertTrue(has_overridden_lost_hooks(CustomOpportunity))
+
+	def test_set_multiple_status_errors(self):
+		lead = frappe.get_doc({"doctype": "Lead", "lead_name": "_Test Multiple Status Lead"}).insert()
+		converted, changed = [frappe.get_doc({
+			"doctype": "Opportunity",
+			"opportunity_from": "Lead",
+			"party_name": lead.name,
+			"transaction_date": nowdate(),
+		}).insert().name for i in range(2)]
+
+		def get_status_dependencies(names, doctype="Opportunity"):
+			return {name: frappe._dict({'is_converted': name == converted, 'has_communication': False})
+				for name in names}
+
+		with patch("crm.crm.doctype.opportunity.opportunity.get_opportunity_status_dependencies_for_names",
+				side_effect=get_status_dependencies), patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql,\
+				patch("frappe.msgprint") as msgprint:
+			out = set_multiple_status([converted, "_Test Missing Opportunity", changed], "Closed")
+
+		self.assertEqual(out.updated, [changed])
+		self.assertEqual([d['name'] for d in out.errors], [converted, "_Test Missing Opportunity"])
+		self.assertEqual(frappe.db.get_value("Opportunity", changed, "status"), "Closed")
+		self.assertNotEqual(frappe.db.get_value("Opportunity", converted, "status"), "Closed")
+
+		updates = [c for c in sql.call_args_list if c.args[0].strip().startswith("update `tabOpportunity`")]
+		self.assertEqual(len(updates), 1)
+
+		# errors are shown to the user
+		self.assertEqual(msgprint.call_count, 1)
+		self.assertEqual(len(msgprint.call_args.args[0]), 3)
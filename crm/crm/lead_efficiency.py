@@ -0,0 +1,130 @@
+import frappe
+from frappe.utils import cint
+
+
+lead_efficiency_table = "__lead_efficiency_summary"
+
+
+def setup_lead_efficiency_table():
+	frappe.db.sql_ddl("""
+		create table if not exists `{0}` (
+			`lead` varchar(140) not null,
+			`opp_count` int(11) not null default 0,
+			`quot_count` int(11) not null default 0,
+			`order_count` int(11) not null default 0,
+			`order_value` decimal(21,9) not null default 0,
+			primary key (`lead`)
+		) engine=InnoDB character set=utf8mb4 collate=utf8mb4_unicode_ci
+	""".format(lead_efficiency_table))
+
+
+def is_lead_efficiency_summary_enabled():
+	return cint(frappe.db.get_single_value("CRM Settings", "use_lead_efficiency_summary"))
+
+
+def get_lead_efficiency_joins(lead_condition=""):
+	"""
+	Returns left joins on `tabLead` l providing opp_count, quot_count, order_count and order_value per lead
+	either from the summary table or from subqueries grouped by lead
+	"""
+	if is_lead_efficiency_summary_enabled() and not lead_condition:
+		return "left join `{0}` les on les.`lead` = l.name".format(lead_efficiency_table)
+
+	return """
+		left join (
+			select party_name, count(name) as opp_count
+			from `tabOpportunity`
+			where opportunity_from = 'Lead' {lead_condition}
+			group by party_name
+		) opp on opp.party_name = l.name
+		left join (
+			select party_name, count(name) as quot_count, sum(status = 'Ordered') as order_count
+			from `tabQuotation`
+			where quotation_to = 'Lead' {lead_condition}
+			group by party_name
+		) quot on quot.party_name = l.name
+		left join (
+			select q.party_name, sum(soi.base_net_amount) as order_value
+			from `tabSales Order Item` soi
+			inner join `tabQuotation` q on q.name = soi.prevdoc_docname
+			where q.status = 'Ordered' and q.quotation_to = 'Lead' {lead_condition_q}
+			group by q.party_name
+		) so on so.party_name = l.name
+	""".format(
+		lead_condition=lead_condition.format(party_name="party_name"),
+		lead_condition_q=lead_condition.format(party_name="q.party_name")
+	)
+
+
+def get_lead_efficiency_columns():
+	if is_lead_efficiency_summary_enabled():
+		return """
+			ifnull(les.opp_count, 0) as opp_count, ifnull(les.quot_count, 0) as quot_count,
+			ifnull(les.order_count, 0) as order_count, ifnull(les.order_value, 0) as order_value
+		"""
+
+	return """
+		ifnull(opp.opp_count, 0) as opp_count, ifnull(quot.quot_count, 0) as quot_count,
+		ifnull(quot.order_count, 0) as order_count, ifnull(so.order_value, 0) as order_value
+	"""
+
+
+def refresh_lead_efficiency_summary(leads):
+	leads = list(set(filter(None, leads)))
+	if not leads:
+		return
+
+	lead_condition = "and {party_name} in %(leads)s"
+	frappe.db.sql("""
+		replace into `{table}` (`lead`, opp_count, quot_count, order_count, order_value)
+		select l.name,
+			ifnull(opp.opp_count, 0), ifnull(quot.quot_count, 0),
+			ifnull(quot.order_count, 0), ifnull(so.order_value, 0)
+		from `tabLead` l
+		{joins}
+		where l.name in %(leads)s
+	""".format(table=lead_efficiency_table, joins=get_lead_efficiency_joins(lead_condition)), {'leads': leads})
+
+	frappe.db.sql("""
+		delete les
+		from `{0}` les
+		left join `tabLead` l on l.name = les.`lead`
+		where les.`lead` in %(leads)s and l.name is null
+	""".format(lead_efficiency_table), {'leads': leads})
+
+
+def rebuild_lead_efficiency_summary(chunk_size=5000):
+	setup_lead_efficiency_table()
+	frappe.db.sql_ddl("truncate `{0}`".format(lead_efficiency_table))
+
+	start = 0
+	while True:
+		leads = frappe.get_all("Lead", order_by="name", limit_start=start, limit_page_length=chunk_size, pluck="name")
+		if not leads:
+			break
+
+		refresh_lead_efficiency_summary(leads)
+		frappe.db.commit()
+
+		start += chunk_size
+
+
+def update_lead_efficiency_summary(doc, method=None):
+	"""Called from hooks on Opportunity, Quotation and Sales Order changes"""
+	leads = []
+
+	if doc.doctype == "Sales Order":
+		quotations = list(set(d.prevdoc_docname for d in doc.get("items", []) if d.get("prevdoc_docname")))
+		if quotations:
+			leads = frappe.get_all("Quotation", filters={'name': ['in', quotations], 'quotation_to': 'Lead'},
+				pluck="party_name")
+	else:
+		party_type_field = "opportunity_from" if doc.doctype == "Opportunity" else "quotation_to"
+		docs = [doc, doc.get_doc_before_save()]
+		leads = [d.party_name for d in docs if d and d.get(party_type_field) == "Lead"]
+
+	refresh_lead_efficiency_summary(leads)
+
+
+def delete_lead_efficiency_summary(doc, method=None):
+	frappe.db.sql("delete from `{0}` where `lead` = %s".format(lead_efficiency_table), doc.name)
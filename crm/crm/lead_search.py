@@ -0,0 +1,150 @@
+import frappe
+from frappe.utils import cstr, cint
+import re
+
+
+lead_search_table = "__lead_search"
+token_length = 140
+token_separators = re.compile(r"[\s@.,;:_()/\\+\-]+")
+
+
+def setup_lead_search_table():
+	frappe.db.sql_ddl("""
+		create table if not exists `{0}` (
+			`token` varchar({1}) not null,
+			`lead` varchar(140) not null,
+			primary key (`token`, `lead`),
+			key `lead` (`lead`)
+		) engine=InnoDB character set=utf8mb4 collate=utf8mb4_unicode_ci
+	""".format(lead_search_table, token_length))
+
+
+def is_lead_search_index_enabled():
+	return cint(frappe.db.get_single_value("CRM Settings", "use_lead_search_index"))
+
+
+def search_leads(fields, txt, start, page_len, fcond="", mcond=""):
+	"""Returns leads whose tokens start with every word in txt, ordered the same way as lead_query"""
+	search_tokens = get_search_tokens(txt)
+	if not search_tokens:
+		return []
+
+	token_joins = []
+	values = {
+		'_txt': txt.replace("%", ""),
+		'start': start,
+		'page_len': page_len,
+	}
+	for i, token in enumerate(search_tokens):
+		values['token{0}'.format(i)] = escape_like(token) + "%"
+		if i:
+			token_joins.append("inner join `{table}` t{i} on t{i}.lead = t0.lead and t{i}.token like %(token{i})s"
+				.format(table=lead_search_table, i=i))
+
+	return frappe.db.sql("""
+		select {fields}
+		from `tabLead`
+		where docstatus < 2
+			and name in (
+				select t0.lead
+				from `{table}` t0
+				{token_joins}
+				where t0.token like %(token0)s
+			)
+			{fcond} {mcond}
+		order by
+			if(locate(%(_txt)s, name), locate(%(_txt)s, name), 99999),
+			if(locate(%(_txt)s, lead_name), locate(%(_txt)s, lead_name), 99999),
+			if(locate(%(_txt)s, company_name), locate(%(_txt)s, company_name), 99999),
+			modified desc,
+			name, lead_name
+		limit %(start)s, %(page_len)s""".format(**{
+			'fields': ", ".join(fields),
+			'table': lead_search_table,
+			'token_joins': "\n".join(token_joins),
+			'fcond': fcond,
+			'mcond': mcond,
+		}), values)
+
+
+def get_search_tokens(txt):
+	tokens = []
+	for word in cstr(txt).lower().split():
+		word = word.replace("%", "")
+		digits = re.sub(r"[^0-9]", "", word)
+
+		# phone numbers are indexed as digits without leading zeros
+		if digits and not re.sub(r"[0-9+\-()\s]", "", word):
+			word = digits.lstrip("0") or digits
+
+		if word:
+			tokens.append(word[:token_length])
+
+	return list(dict.fromkeys(tokens))
+
+
+def get_lead_tokens(doc):
+	tokens = set()
+
+	values = [doc.name] + [doc.get(f) for f in frappe.get_meta("Lead").get_search_fields()]
+	for value in values:
+		value = cstr(value).strip().lower()
+		if not value:
+			continue
+
+		# the whole value for prefix matching emails and full names
+		tokens.add(value[:token_length])
+
+		for word in token_separators.split(value):
+			if word:
+				tokens.add(word[:token_length])
+
+		digits = re.sub(r"[^0-9]", "", value)
+		if digits:
+			tokens.add(digits[:token_length])
+			if digits.lstrip("0"):
+				tokens.add(digits.lstrip("0")[:token_length])
+
+	return tokens
+
+
+def update_lead_search_tokens(doc, method=None):
+	frappe.db.sql("delete from `{0}` where `lead` = %s".format(lead_search_table), doc.name)
+	insert_lead_search_tokens({doc.name: get_lead_tokens(doc)})
+
+
+def delete_lead_search_tokens(doc, method=None):
+	frappe.db.sql("delete from `{0}` where `lead` = %s".format(lead_search_table), doc.name)
+
+
+def insert_lead_search_tokens(lead_tokens):
+	values = [(token, lead) for lead, tokens in lead_tokens.items() for token in tokens]
+	if not values:
+		return
+
+	frappe.db.sql("""
+		insert ignore into `{0}` (`token`, `lead`)
+		values {1}
+	""".format(lead_search_table, ", ".join(["(%s, %s)"] * len(values))), [v for row in values for v in row])
+
+
+def rebuild_lead_search_index(chunk_size=5000):
+	setup_lead_search_table()
+	frappe.db.sql_ddl("truncate `{0}`".format(lead_search_table))
+
+	fields = list(set(["name"] + frappe.get_meta("Lead").get_search_fields()))
+
+	start = 0
+	while True:
+		leads = frappe.get_all("Lead", fields=fields, order_by="name", limit_start=start, limit_page_length=chunk_size)
+		if not leads:
+			break
+
+		insert_lead_search_tokens({d.name: get_lead_tokens(d) for d in leads})
+		frappe.db.commit()
+
+		start += chunk_size
+
+
+def escape_like(txt):
+	return txt.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
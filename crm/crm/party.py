@@ -0,0 +1,323 @@
+import frappe
+from frappe import _
+from frappe.utils import cstr, cint
+import copy
+import json
+
+
+update_party_details_background_threshold = 100
+
+
+def get_party_details(party_type, party_name, contact_person=None, customer_address=None):
+	return resolve_many([(party_type, party_name, contact_person, customer_address)])[0]
+
+
+def resolve_many(parties):
+	"""
+	Returns party details for a list of (party_type, party_name, contact_person, customer_address) tuples
+	Parties, default addresses and contacts, addresses and contacts are loaded with one query per table
+	and results are memoized for the request
+	"""
+	memo = get_party_details_memo()
+
+	keys = [tuple(cstr(v) or None for v in party) for party in parties]
+	missing_keys = [key for key in dict.fromkeys(keys) if key not in memo]
+
+	if missing_keys:
+		party_docs = load_parties([(party_type, party_name) for party_type, party_name, contact, address in missing_keys])
+
+		default_addresses, default_contacts = load_party_defaults(party_docs.values())
+
+		for key in missing_keys:
+			memo[key] = _get_party_details(key, party_docs, default_addresses, default_contacts)
+
+		load_address_displays(memo, missing_keys)
+		load_contact_details(memo, missing_keys)
+
+	return [copy.deepcopy(memo[key]) for key in keys]
+
+
+def _get_party_details(key, party_docs, default_addresses, default_contacts):
+	party_type, party_name, contact_person, customer_address = key
+	party = party_docs.get((party_type, party_name)) or frappe._dict()
+
+	out = frappe._dict()
+	out.party = party
+
+	# Customer Name
+	if party.doctype == "Lead":
+		out.customer_name = party.company_name or party.lead_name
+	else:
+		out.customer_name = party.get("customer_name")
+
+	# Tax IDs
+	out.tax_id = party.get('tax_id')
+	out.tax_cnic = party.get('tax_cnic')
+	out.tax_strn = party.get('tax_strn')
+
+	# Address
+	out.customer_address = customer_address
+	if not out.customer_address and party.name and party.doctype != "Lead":
+		out.customer_address = default_addresses.get((party.doctype, party.name))
+
+	# Contact
+	out.contact_person = contact_person
+	if not out.contact_person and party.name and party.doctype != "Lead":
+		out.contact_person = default_contacts.get((party.doctype, party.name))
+
+	return out
+
+
+def load_parties(parties):
+	party_docs = {}
+
+	names_by_party_type = {}
+	for party_type, party_name in parties:
+		if party_type and party_name:
+			names_by_party_type.setdefault(party_type, set()).add(party_name)
+
+	for party_type, names in names_by_party_type.items():
+		for d in frappe.get_all(party_type, filters={'name': ['in', list(names)]}, fields=['*']):
+			d.doctype = party_type
+			party_docs[(party_type, d.name)] = d
+
+		for name in names:
+			if (party_type, name) not in party_docs:
+				frappe.throw(_("{0} {1} not found").format(_(party_type), name), frappe.DoesNotExistError)
+
+	return party_docs
+
+
+def load_party_defaults(parties):
+	"""
+	Returns default Address and Contact of each party with one query per table
+	preferring primary ones like get_default_address and get_default_contact
+	"""
+	links_by_doctype = {}
+	for party in parties:
+		if party.doctype != "Lead":
+			links_by_doctype.setdefault(party.doctype, []).append(party.name)
+
+	default_addresses = {}
+	default_contacts = {}
+	for link_doctype, link_names in links_by_doctype.items():
+		addresses = frappe.db.sql("""
+			select dl.link_name, addr.name, addr.is_primary_address as is_primary
+			from `tabAddress` addr
+			inner join `tabDynamic Link` dl on dl.parent = addr.name and dl.parenttype = 'Address'
+			where dl.link_doctype = %(link_doctype)s and dl.link_name in %(link_names)s
+				and ifnull(addr.disabled, 0) = 0
+		""", {'link_doctype': link_doctype, 'link_names': link_names}, as_dict=1)
+		set_party_defaults(default_addresses, link_doctype, addresses)
+
+		contacts = frappe.db.sql("""
+			select dl.link_name, c.name, c.is_primary_contact as is_primary
+			from `tabContact` c
+			inner join `tabDynamic Link` dl on dl.parent = c.name and dl.parenttype = 'Contact'
+			where dl.link_doctype = %(link_doctype)s and dl.link_name in %(link_names)s
+		""", {'link_doctype': link_doctype, 'link_names': link_names}, as_dict=1)
+		set_party_defaults(default_contacts, link_doctype, contacts)
+
+	return default_addresses, default_contacts
+
+
+def set_party_defaults(defaults, link_doctype, rows):
+	# the first primary row of a party is its default, otherwise its first row
+	primary_found = set()
+	for d in rows:
+		key = (link_doctype, d.link_name)
+		if key not in defaults or (cint(d.is_primary) and key not in primary_found):
+			defaults[key] = d.name
+
+		if cint(d.is_primary):
+			primary_found.add(key)
+
+
+def load_address_displays(memo, keys):
+	from frappe.contacts.doctype.address.address import get_address_display
+	from crm.crm.doctype.lead.lead import get_lead_address_details
+
+	address_names = list(set(memo[key].customer_address for key in keys if memo[key].customer_address))
+	addresses = {}
+	if address_names:
+		addresses = {d.name: d for d in frappe.get_all("Address", filters={'name': ['in', address_names]},
+			fields=['*'])}
+
+	for key in keys:
+		details = memo[key]
+		if details.customer_address:
+			address = addresses.get(details.customer_address)
+			details.address_display = get_address_display(address) if address else None
+		elif details.party.doctype == "Lead":
+			details.address_display = get_address_display(get_lead_address_details(details.party))
+		else:
+			details.address_display = None
+
+
+def load_contact_details(memo, keys):
+	load_contacts_into_memo([memo[key].contact_person for key in keys])
+
+	for key in keys:
+		details = memo[key]
+		lead = details.party if details.party.doctype == "Lead" else None
+		details.update(get_contact_details(details.contact_person, lead=lead))
+
+
+def get_contact_details(contact=None, lead=None):
+	from crm.crm.utils import get_contact_details
+
+	if contact:
+		memo = load_contacts_into_memo([contact])
+		return copy.deepcopy(memo[("Contact", contact)])
+
+	return get_contact_details(None, lead=lead)
+
+
+def load_contacts_into_memo(contacts):
+	"""Loads contact details of Contacts not yet in the memo with one query per table"""
+	memo = get_party_details_memo()
+
+	names = list(set(contact for contact in contacts if contact and ("Contact", contact) not in memo))
+	if not names:
+		return memo
+
+	contact_docs = {d.name: d for d in frappe.db.sql("""
+		select *
+		from `tabContact`
+		where name in %(names)s
+	""", {'names': names}, as_dict=1)}
+
+	for name in names:
+		if name not in contact_docs:
+			frappe.throw(_("{0} {1} not found").format(_("Contact"), name), frappe.DoesNotExistError)
+
+	for d in contact_docs.values():
+		d.email_ids = []
+		d.phone_nos = []
+
+	for d in frappe.db.sql("""
+		select parent, email_id, is_primary
+		from `tabContact Email`
+		where parenttype = 'Contact' and parent in %(names)s
+		order by idx
+	""", {'names': names}, as_dict=1):
+		contact_docs[d.parent].email_ids.append(d)
+
+	for d in frappe.db.sql("""
+		select parent, phone, is_primary_phone, is_primary_mobile_no
+		from `tabContact Phone`
+		where parenttype = 'Contact' and parent in %(names)s
+		order by idx
+	""", {'names': names}, as_dict=1):
+		contact_docs[d.parent].phone_nos.append(d)
+
+	for name, contact in contact_docs.items():
+		memo[("Contact", name)] = _get_contact_details(contact)
+
+	return memo
+
+
+def _get_contact_details(contact):
+	def get_primary(rows, fieldname, primary_field):
+		return next((d.get(fieldname) for d in rows if cint(d.get(primary_field))), None)
+
+	out = frappe._dict({
+		"contact_person": contact.name,
+		"contact_display": " ".join(filter(None, [contact.salutation, contact.first_name, contact.last_name])),
+		"contact_email": contact.email_id or get_primary(contact.email_ids, 'email_id', 'is_primary'),
+		"contact_mobile": contact.mobile_no or get_primary(contact.phone_nos, 'phone', 'is_primary_mobile_no'),
+		"contact_phone": contact.phone or get_primary(contact.phone_nos, 'phone', 'is_primary_phone'),
+		"contact_designation": contact.get('designation'),
+		"contact_department": contact.get('department'),
+	})
+
+	if 'mobile_no_2' in contact:
+		out.contact_mobile_2 = contact.mobile_no_2
+
+	return out
+
+
+def prime_party_details(docs):
+	"""Resolves party details of many Opportunities or Appointments in one batch so that their validates use the memo"""
+	resolve_many([(doc.get(doc.party_type_field), doc.get('party_name'), doc.get('contact_person'),
+		doc.get('customer_address')) for doc in docs])
+
+	load_contacts_into_memo([doc.get('secondary_contact_person') for doc in docs])
+
+
+@frappe.whitelist()
+def update_party_details(doctype, names):
+	if isinstance(names, str):
+		names = json.loads(names)
+
+	if doctype not in ("Opportunity", "Appointment"):
+		frappe.throw(_("Cannot update party details of {0}").format(_(doctype)))
+
+	names = list(dict.fromkeys(names or []))
+
+	if len(names) > update_party_details_background_threshold:
+		frappe.enqueue("crm.crm.party.update_party_details_in_bulk", queue="long", timeout=3000,
+			doctype=doctype, names=names)
+		frappe.msgprint(_("Party details of {0} {1} will be updated in the background").format(len(names), _(doctype)),
+			alert=True)
+		return
+
+	update_party_details_in_bulk(doctype, names)
+
+
+def update_party_details_in_bulk(doctype, names, chunk_size=500):
+	"""Refreshes party details of many documents, resolving the parties of each chunk in one batch"""
+	for i in range(0, len(names), chunk_size):
+		docs = [frappe.get_doc(doctype, name) for name in names[i:i + chunk_size]]
+		docs = [doc for doc in docs if doc.docstatus < 2]
+
+		for doc in docs:
+			doc.check_permission("write")
+
+		prime_party_details(docs)
+
+		for doc in docs:
+			doc.flags.refresh_party_details = True
+			doc.save()
+
+		frappe.db.commit()
+
+
+def needs_party_details_refresh(doc, party_link_fields):
+	"""Returns True if the document is new, refresh is requested or any of the party link fields changed"""
+	if doc.flags.refresh_party_details:
+		return True
+
+	doc_before_save = doc.get_doc_before_save()
+	if not doc_before_save:
+		return True
+
+	for fieldname in party_link_fields:
+		if cstr(doc.get(fieldname)) != cstr(doc_before_save.get(fieldname)):
+			return True
+
+	increment_skipped_party_details_refresh_count(doc.doctype)
+	return False
+
+
+def increment_skipped_party_details_refresh_count(doctype):
+	frappe.cache().incr(get_skipped_party_details_refresh_key(doctype))
+
+
+def get_skipped_party_details_refresh_count(doctype):
+	return cint(frappe.cache().get(get_skipped_party_details_refresh_key(doctype)))
+
+
+def get_skipped_party_details_refresh_key(doctype):
+	return frappe.cache().make_key("skipped_party_details_refresh:{0}".format(doctype))
+
+
+def get_party_details_memo():
+	if frappe.flags.party_details_memo is None:
+		frappe.flags.party_details_memo = {}
+
+	return frappe.flags.party_details_memo
+
+
+def clear_party_details_memo(doc=None, method=None):
+	frappe.flags.party_details_memo = None
@@ -0,0 +1,136 @@
+import frappe
+from frappe.utils import cstr
+import re
+
+
+phone_number_table = "__phone_number_index"
+
+# numbers are stored as digits without leading zeros and reversed so that suffix matches become prefix index seeks
+phone_number_fields = {
+	"Lead": ["phone", "mobile_no", "mobile_no_2"],
+	"Employee": ["cell_number"],
+	"Call Log": ["from"],
+}
+
+
+def setup_phone_number_table():
+	frappe.db.sql_ddl("""
+		create table if not exists `{0}` (
+			`reversed_number` varchar(40) not null,
+			`reference_doctype` varchar(140) not null,
+			`reference_name` varchar(140) not null,
+			primary key (`reversed_number`, `reference_doctype`, `reference_name`),
+			key `reference` (`reference_doctype`, `reference_name`)
+		) engine=InnoDB character set=utf8mb4 collate=utf8mb4_unicode_ci
+	""".format(phone_number_table))
+
+
+def normalize_number(number):
+	"""Returns digits of the number without leading zeros, eg. 0300-1234567 and 3001234567 both become 3001234567"""
+	return re.sub(r"[^0-9]", "", cstr(number)).lstrip('0')
+
+
+def get_reversed_number(number):
+	return normalize_number(number)[::-1][:40]
+
+
+def get_numbers(doc):
+	if doc.doctype == "Contact":
+		return [d.phone for d in doc.get('phone_nos', [])]
+
+	return [doc.get(f) for f in phone_number_fields.get(doc.doctype, [])]
+
+
+def find_by_phone_number(number, reference_doctype, limit=None):
+	"""Returns names of documents of reference_doctype having a number ending with the given number"""
+	reversed_number = get_reversed_number(number)
+	if not reversed_number:
+		return []
+
+	return frappe.db.sql_list("""
+		select distinct reference_name
+		from `{0}`
+		where reversed_number like %(reversed_number)s and reference_doctype = %(reference_doctype)s
+		{1}
+	""".format(phone_number_table, "limit {0}".format(int(limit)) if limit else ""), {
+		'reversed_number': reversed_number + "%",
+		'reference_doctype': reference_doctype,
+	})
+
+
+def find_by_phone_numbers(numbers, reference_doctype, chunk_size=500):
+	"""
+	Returns a list of (reversed_number, reference_name) of documents of reference_doctype
+	having a number ending with any of the given numbers
+	"""
+	reversed_numbers = sorted(set(filter(None, [get_reversed_number(number) for number in numbers])))
+
+	out = []
+	for i in range(0, len(reversed_numbers), chunk_size):
+		chunk = reversed_numbers[i:i + chunk_size]
+		out += frappe.db.sql("""
+			select reversed_number, reference_name
+			from `{0}`
+			where reference_doctype = %s and ({1})
+		""".format(phone_number_table, " or ".join(["reversed_number like %s"] * len(chunk))),
+			[reference_doctype] + [reversed_number + "%" for reversed_number in chunk])
+
+	return out
+
+
+def update_phone_number_index(doc, method=None):
+	delete_phone_number_index(doc)
+	insert_phone_numbers({(doc.doctype, doc.name): get_numbers(doc)})
+
+
+def delete_phone_number_index(doc, method=None):
+	frappe.db.sql("""
+		delete from `{0}`
+		where reference_doctype = %s and reference_name = %s
+	""".format(phone_number_table), (doc.doctype, doc.name))
+
+
+def insert_phone_numbers(numbers_by_reference):
+	values = set()
+	for (reference_doctype, reference_name), numbers in numbers_by_reference.items():
+		for number in numbers:
+			reversed_number = get_reversed_number(number)
+			if reversed_number:
+				values.add((reversed_number, reference_doctype, reference_name))
+
+	if not values:
+		return
+
+	frappe.db.sql("""
+		insert ignore into `{0}` (reversed_number, reference_doctype, reference_name)
+		values {1}
+	""".format(phone_number_table, ", ".join(["(%s, %s, %s)"] * len(values))), [v for row in values for v in row])
+
+
+def rebuild_phone_number_index(chunk_size=5000):
+	setup_phone_number_table()
+	frappe.db.sql_ddl("truncate `{0}`".format(phone_number_table))
+
+	for doctype, fields in phone_number_fields.items():
+		if not frappe.db.table_exists(doctype):
+			continue
+
+		start = 0
+		while True:
+			docs = frappe.get_all(doctype, fields=["name"] + ["`{0}`".format(f) for f in fields], order_by="name",
+				limit_start=start, limit_page_length=chunk_size)
+			if not docs:
+				break
+
+			insert_phone_numbers({(doctype, d.name): [d.get(f) for f in fields] for d in docs})
+			frappe.db.commit()
+			start += chunk_size
+
+	contact_numbers = {}
+	for d in frappe.get_all("Contact Phone", filters={'parenttype': 'Contact'}, fields=['parent', 'phone']):
+		contact_numbers.setdefault(("Contact", d.parent), []).append(d.phone)
+
+	references = list(contact_numbers)
+	for i in range(0, len(references), chunk_size):
+		insert_phone_numbers({reference: contact_numbers[reference] for reference in references[i:i + chunk_size]})
+		frappe.db.commit()
@@ -4,6 +4,7 @@
 import frappe
 from frappe import _
 from frappe.utils import flt
+from crm.crm.lead_efficiency import get_lead_efficiency_columns, get_lead_efficiency_joins
 
 def execute(filters=None):
 	columns, data = [], []
@@ -70,65 +71,47 @@ def get_columns(based_on):
 	]
 
 def get_lead_data(filters, based_on):
+	filters = frappe._dict(filters or {})
 	based_on_field = frappe.scrub(based_on)
 	conditions = get_filter_conditions(filters)
 
-	lead_details = frappe.db.sql("""
-		select {based_on_field}, name
-		from `tabLead`
-		where {based_on_field} is not null and {based_on_field} != '' {conditions}
-	""".format(based_on_field=based_on_field, conditions=conditions), filters, as_dict=1)
-
-	lead_map = frappe._dict()
-	for d in lead_details:
-		lead_map.setdefault(d.get(based_on_field), []).append(d.name)
-
-	data = []
-	for based_on_value, leads in lead_map.items():
-		row = {
-			based_on_field: based_on_value,
-			"lead_count": len(leads)
-		}
-		row["quot_count"]= get_lead_quotation_count(leads)
-		row["opp_count"] = get_lead_opp_count(leads)
-		row["order_count"] = get_quotation_ordered_count(leads)
-		row["order_value"] = get_order_amount(leads) or 0
+	# opportunity, quotation and order counts are aggregated per lead and then per based on value in one query
+	data = frappe.db.sql("""
+		select l.{based_on_field},
+			count(l.name) as lead_count,
+			sum(opp_count) as opp_count,
+			sum(quot_count) as quot_count,
+			sum(order_count) as order_count,
+			sum(order_value) as order_value
+		from (
+			select l.name, l.{based_on_field}, {lead_efficiency_columns}
+			from `tabLead` l
+			{lead_efficiency_joins}
+			where l.{based_on_field} is not null and l.{based_on_field} != '' {conditions}
+		) l
+		group by l.{based_on_field}
+	""".format(
+		based_on_field=based_on_field,
+		conditions=conditions,
+		lead_efficiency_columns=get_lead_efficiency_columns(),
+		lead_efficiency_joins=get_lead_efficiency_joins()
+	), filters, as_dict=1)
+
+	for row in data:
+		row["order_value"] = flt(row["order_value"])
 
 		row["opp_lead"] = flt(row["opp_count"]) / flt(row["lead_count"] or 1.0) * 100.0
 		row["quot_lead"] = flt(row["quot_count"]) / flt(row["lead_count"] or 1.0) * 100.0
 
 		row["order_quot"] = flt(row["order_count"]) / flt(row["quot_count"] or 1.0) * 100.0
 
-		data.append(row)
-
 	return data
 
 def get_filter_conditions(filters):
 	conditions=""
 	if filters.from_date:
-		conditions += " and date(creation) >= %(from_date)s"
+		conditions += " and date(l.creation) >= %(from_date)s"
 	if filters.to_date:
-		conditions += " and date(creation) <= %(to_date)s"
+		conditions += " and date(l.creation) <= %(to_date)s"
 
 	return conditions
-
-def get_lead_quotation_count(leads):
-	return frappe.db.sql("""select count(name) from `tabQuotation`
-		where quotation_to = 'Lead' and party_name in (%s)""" % ', '.join(["%s"]*len(leads)), tuple(leads))[0][0] #nosec
-
-def get_lead_opp_count(leads):
-	return frappe.db.sql("""select count(name) from `tabOpportunity`
-	where opportunity_from = 'Lead' and party_name in (%s)""" % ', '.join(["%s"]*len(leads)), tuple(leads))[0][0]
-
-def get_quotation_ordered_count(leads):
-	return frappe.db.sql("""select count(name)
-		from `tabQuotation` where status = 'Ordered' and quotation_to = 'Lead'
-		and party_name in (%s)""" % ', '.join(["%s"]*len(leads)), tuple(leads))[0][0]
-
-def get_order_amount(leads):
-	return frappe.db.sql("""select sum(base_net_amount)
-		from `tabSales Order Item`
-		where prevdoc_docname in (
-			select name from `tabQuotation` where status = 'Ordered'
-			and quotation_to = 'Lead' and party_name in (%s)
-		)""" % ', '.join(["%s"]*len(leads)), tuple(leads))[0][0]
\ No newline at end of file
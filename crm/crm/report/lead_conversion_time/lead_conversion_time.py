@@ -3,7 +3,6 @@
 
 import frappe
 from frappe import _, msgprint
-from frappe.utils import date_diff, flt
 
 def execute(filters=None):
 	if not filters: filters = {}
@@ -63,51 +62,58 @@ def get_columns():
 	]
 
 def get_communication_details(filters):
-	communication_count = None
-	communication_list = []
-	opportunities = frappe.db.get_values('Opportunity', {'opportunity_from': 'Lead'},\
-		['name', 'customer_name', 'contact_email'], as_dict=1)
-
-	for d in opportunities:
-		invoice = frappe.db.sql('''
-				SELECT
-					date(creation)
-				FROM
-					`tabSales Invoice`
-				WHERE
-					contact_email = %s AND date(creation) between %s and %s AND docstatus != 2
-				ORDER BY
-					creation
-				LIMIT 1
-			''', (d.contact_email, filters.from_date, filters.to_date))
-
-		if not invoice: continue
-
-		communication_count = frappe.db.sql('''
-				SELECT
-					count(*)
-				FROM
-					`tabCommunication`
-				WHERE
-					sender = %s AND date(communication_date) <= %s
-			''', (d.contact_email, invoice))[0][0]
-
-		if not communication_count: continue
-
-		first_contact = frappe.db.sql('''
-				SELECT
-					date(communication_date)
-				FROM
-					`tabCommunication`
-				WHERE
-					recipients  = %s
-				ORDER BY
-					communication_date
-				LIMIT 1
-			''', (d.contact_email))[0][0]
-
-		duration = flt(date_diff(invoice[0][0], first_contact))
-
-		support_tickets = len(frappe.db.get_all('Issue', {'raised_by': d.contact_email}))
-		communication_list.append({'customer': d.customer_name, 'interactions': communication_count, 'duration': duration, 'support_tickets': support_tickets})
-	return communication_list
+	filters = frappe._dict(filters)
+
+	# first invoice, interactions until the first invoice, first contact and tickets are computed per email
+	return frappe.db.sql('''
+		WITH first_invoice AS (
+			SELECT
+				contact_email, min(date(creation)) AS invoice_date
+			FROM
+				`tabSales Invoice`
+			WHERE
+				ifnull(contact_email, '') != '' AND date(creation) between %(from_date)s and %(to_date)s
+				AND docstatus != 2
+			GROUP BY
+				contact_email
+		)
+		SELECT
+			o.customer_name AS customer,
+			interaction.interactions,
+			ifnull(datediff(inv.invoice_date, first_contact.first_contact_date), 0) AS duration,
+			ifnull(issue.support_tickets, 0) AS support_tickets
+		FROM
+			`tabOpportunity` o
+		INNER JOIN first_invoice inv ON inv.contact_email = o.contact_email
+		INNER JOIN (
+			SELECT
+				c.sender, count(*) AS interactions
+			FROM
+				`tabCommunication` c
+			INNER JOIN first_invoice inv ON inv.contact_email = c.sender
+			WHERE
+				date(c.communication_date) <= inv.invoice_date
+			GROUP BY
+				c.sender
+		) interaction ON interaction.sender = o.contact_email
+		LEFT JOIN (
+			SELECT
+				c.recipients, min(date(c.communication_date)) AS first_contact_date
+			FROM
+				`tabCommunication` c
+			INNER JOIN first_invoice inv ON inv.contact_email = c.recipients
+			GROUP BY
+				c.recipients
+		) first_contact ON first_contact.recipients = o.contact_email
+		LEFT JOIN (
+			SELECT
+				i.raised_by, count(*) AS support_tickets
+			FROM
+				`tabIssue` i
+			INNER JOIN first_invoice inv ON inv.contact_email = i.raised_by
+			GROUP BY
+				i.raised_by
+		) issue ON issue.raised_by = o.contact_email
+		WHERE
+			o.opportunity_from = 'Lead'
+	''', filters, as_dict=1)
@@ -1,5 +1,7 @@
 import frappe
-from frappe.utils import cstr
+from frappe.utils import cstr, to_timedelta
+import datetime
+import bisect
 
 
 @frappe.whitelist()
@@ -90,25 +92,77 @@ def get_last_issue_from_customer(customer_name):
 def get_scheduled_employees_for_popup(communication_medium):
 	if not communication_medium: return []
 
-	now_time = frappe.utils.nowtime()
+	now_time = time_to_microseconds(frappe.utils.nowtime())
 	weekday = frappe.utils.get_weekday()
 
-	available_employee_groups = frappe.get_all("Communication Medium Timeslot", filters={
-		'day_of_week': weekday,
-		'parent': communication_medium,
-		'from_time': ['<=', now_time],
-		'to_time': ['>=', now_time],
-	}, fields=['employee_group'])
+	schedule = get_communication_medium_schedule(communication_medium)
+	segment_starts, segment_users = schedule.get(weekday) or ([], [])
+
+	i = bisect.bisect_right(segment_starts, now_time) - 1
+	if i < 0:
+		return set()
+
+	return set(segment_users[i])
+
 
-	available_employee_groups = tuple([emp.employee_group for emp in available_employee_groups])
+def get_communication_medium_schedule(communication_medium):
+	return frappe.cache().hget("communication_medium_schedule", communication_medium,
+		generator=lambda: build_communication_medium_schedule(communication_medium))
 
-	employees = frappe.get_all('Employee Group Table', filters={
-		'parent': ['in', available_employee_groups]
-	}, fields=['user_id'])
 
-	employee_emails = set([employee.user_id for employee in employees])
+def build_communication_medium_schedule(communication_medium):
+	"""
+	Returns {weekday: (segment_starts, segment_users)} where segment_starts are sorted times in microseconds
+	and segment_users[i] are the users on duty from segment_starts[i] until segment_starts[i + 1]
+	"""
+	timeslots = frappe.get_all("Communication Medium Timeslot", filters={
+		'parent': communication_medium,
+		'parenttype': 'Communication Medium',
+	}, fields=['day_of_week', 'from_time', 'to_time', 'employee_group'])
+
+	employee_groups = list(set(d.employee_group for d in timeslots if d.employee_group))
+	group_users = {}
+	if employee_groups:
+		for d in frappe.get_all('Employee Group Table', filters={'parent': ['in', employee_groups]},
+				fields=['parent', 'user_id']):
+			if d.user_id:
+				group_users.setdefault(d.parent, set()).add(d.user_id)
+
+	intervals_by_weekday = {}
+	for d in timeslots:
+		if not d.employee_group or d.from_time is None or d.to_time is None:
+			continue
+
+		# to_time is inclusive
+		interval = (time_to_microseconds(d.from_time), time_to_microseconds(d.to_time) + 1,
+			group_users.get(d.employee_group, set()))
+		intervals_by_weekday.setdefault(d.day_of_week, []).append(interval)
+
+	schedule = {}
+	for weekday, intervals in intervals_by_weekday.items():
+		segment_starts = sorted(set([d[0] for d in intervals] + [d[1] for d in intervals]))
+		segment_users = []
+		for start in segment_starts:
+			users = set()
+			for from_time, to_time, interval_users in intervals:
+				if from_time <= start < to_time:
+					users |= interval_users
+			segment_users.append(tuple(sorted(users)))
+
+		schedule[weekday] = (segment_starts, segment_users)
+
+	return schedule
+
+
+def clear_communication_medium_schedule(doc=None, method=None):
+	if doc and doc.doctype == "Communication Medium":
+		frappe.cache().hdel("communication_medium_schedule", doc.name)
+	else:
+		frappe.cache().delete_value("communication_medium_schedule")
+
 
-	return employee_emails
+def time_to_microseconds(time):
+	return int(to_timedelta(time) / datetime.timedelta(microseconds=1))
 
 
 def strip_number(number):
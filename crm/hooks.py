@@ -25,9 +25,62 @@ doctype_js = {
 doc_events = {
 	"Contact": {
 		"after_insert": "crm.communication.doctype.call_log.call_log.set_caller_information",
+		"on_update": [
+			"crm.crm.party.clear_party_details_memo",
+			"crm.crm.phone_number_index.update_phone_number_index",
+		],
+		"on_trash": "crm.crm.phone_number_index.delete_phone_number_index",
+	},
+	"Address": {
+		"on_update": "crm.crm.party.clear_party_details_memo",
+	},
+	"Communication": {
+		"after_insert": "crm.crm.doctype.opportunity.opportunity.clear_opportunity_status_memo_for_communication",
+		"on_update": "crm.crm.doctype.opportunity.opportunity.clear_opportunity_status_memo_for_communication",
+		"on_trash": "crm.crm.doctype.opportunity.opportunity.clear_opportunity_status_memo_for_communication",
 	},
 	"Lead": {
-		"after_insert": "crm.communication.doctype.call_log.call_log.set_caller_information"
+		"after_insert": "crm.communication.doctype.call_log.call_log.set_caller_information",
+		"on_update": [
+			"crm.crm.party.clear_party_details_memo",
+			"crm.crm.lead_search.update_lead_search_tokens",
+			"crm.crm.phone_number_index.update_phone_number_index",
+		],
+		"on_trash": [
+			"crm.crm.lead_search.delete_lead_search_tokens",
+			"crm.crm.phone_number_index.delete_phone_number_index",
+			"crm.crm.lead_efficiency.delete_lead_efficiency_summary",
+		],
+	},
+	"Opportunity": {
+		"on_update": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+		"after_delete": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+	},
+	"Quotation": {
+		"on_update": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+		"on_update_after_submit": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+		"on_cancel": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+		"after_delete": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+	},
+	"Sales Order": {
+		"on_update": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+		"on_submit": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+		"on_cancel": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+		"after_delete": "crm.crm.lead_efficiency.update_lead_efficiency_summary",
+	},
+	"Employee": {
+		"on_update": [
+			"crm.crm.phone_number_index.update_phone_number_index",
+			"crm.communication.doctype.call_log.call_log.clear_employees_with_number_cache",
+		],
+		"on_trash": [
+			"crm.crm.phone_number_index.delete_phone_number_index",
+			"crm.communication.doctype.call_log.call_log.clear_employees_with_number_cache",
+		],
+	},
+	"Employee Group": {
+		"on_update": "crm.crm.utils.clear_communication_medium_schedule",
+		"on_trash": "crm.crm.utils.clear_communication_medium_schedule",
 	},
 	"Email Unsubscribe": {
 		"after_insert": "crm.crm.doctype.email_campaign.email_campaign.unsubscribe_recipient"
@@ -49,6 +102,11 @@ fixtures = [
 scheduler_events = {
 	"all": [
 		"crm.crm.doctype.appointment.appointment.send_appointment_reminder_notifications",
+		"crm.communication.doctype.call_log.call_log.set_pending_caller_information",
+		"crm.communication.doctype.sms_dispatch_log.sms_dispatch_log.dispatch_sms_chunks",
+	],
+	"hourly": [
+		"crm.crm.doctype.appointment.appointment.reconcile_appointment_occupancy_cache",
 	],
 	"daily": [
 		"crm.crm.doctype.opportunity.opportunity.auto_mark_opportunity_as_lost",
@@ -56,6 +114,7 @@ scheduler_events = {
 		"crm.crm.doctype.contract.contract.update_status_for_contracts",
 		"crm.crm.doctype.email_campaign.email_campaign.send_email_to_leads_or_contacts",
 		"crm.crm.doctype.email_campaign.email_campaign.set_email_campaign_status",
+		"crm.communication.doctype.sms_center.sms_center.remove_old_receiver_list_files",
 	]
 }
 
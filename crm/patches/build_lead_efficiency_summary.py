@@ -0,0 +1,5 @@
+from crm.crm.lead_efficiency import rebuild_lead_efficiency_summary
+
+
+def execute():
+	rebuild_lead_efficiency_summary()
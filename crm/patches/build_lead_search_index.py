@@ -0,0 +1,5 @@
+from crm.crm.lead_search import rebuild_lead_search_index
+
+
+def execute():
+	rebuild_lead_search_index()
@@ -0,0 +1,5 @@
+from crm.crm.phone_number_index import rebuild_phone_number_index
+
+
+def execute():
+	rebuild_phone_number_index()
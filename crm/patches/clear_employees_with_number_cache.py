@@ -0,0 +1,6 @@
+from crm.communication.doctype.call_log.call_log import clear_employees_with_number_cache, warmup_employee_number_map
+
+
+def execute():
+	clear_employees_with_number_cache()
+	warmup_employee_number_map()
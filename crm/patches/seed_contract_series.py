@@ -0,0 +1,5 @@
+from crm.crm.doctype.contract.contract import seed_contract_series
+
+
+def execute():
+	seed_contract_series()
@@ -0,0 +1,8 @@
+import frappe
+
+
+def execute():
+	from crm.crm.doctype.lead.lead import update_lead_opportunity_counts
+
+	frappe.reload_doctype("Lead")
+	update_lead_opportunity_counts()
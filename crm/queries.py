@@ -6,8 +6,15 @@ from frappe.utils import unique
 @frappe.whitelist()
 @frappe.validate_and_sanitize_search_inputs
 def lead_query(doctype, txt, searchfield, start, page_len, filters):
+	from crm.crm.lead_search import is_lead_search_index_enabled, search_leads
+
 	fields = get_fields("Lead", ["name", "lead_name", "company_name"])
 
+	if txt and txt.strip() and is_lead_search_index_enabled():
+		return search_leads(fields, txt, start, page_len,
+			fcond=get_filters_cond(doctype, filters, []).replace('%', '%%'),
+			mcond=get_match_cond(doctype))
+
 	searchfields = frappe.get_meta("Lead").get_search_fields()
 	searchfields = " or ".join([field + " like %(txt)s" for field in searchfields])
 